@@ -0,0 +1,82 @@
+"""
+Growable sample buffer of one run's acquisition
+
+Replaces a fixed-size Python list of readings: each field (time, force,
+stage position) is a row of one preallocated numpy array that grows a chunk
+at a time when full, so a slow run never overflows it and a short one never
+carries unused trailing slots. view() hands out the filled part without
+copying, for saving the run and for live display.
+"""
+import numpy as np
+
+FIELDS = ('time', 'force', 'position')
+
+class SampleBuffer():
+    """
+    Typed, growable (fields x samples) buffer with a fill level
+
+    Views returned by view() share memory with the buffer; they stay valid
+    until an extend() has to grow it, take a new view after that.
+    """
+    def __init__(self, fields=FIELDS, chunk=4096, dtype=np.float64):
+        """
+        Parameters:
+            fields: Names of the values recorded per sample
+            chunk: Samples allocated up front and added each time the buffer is full
+            dtype: numpy dtype of the storage
+        """
+        chunk = int(chunk)
+        if chunk < 1:
+            raise ValueError(f"Invalid chunk: {chunk}")
+        self.fields = tuple(fields)
+        self.chunk = chunk
+        self.data = np.empty((len(self.fields), chunk), dtype=dtype)
+        self.size = 0 # samples filled
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return self.data.shape[1]
+
+    def _reserve(self, n):
+        """Grow (in whole chunks) so n more samples fit"""
+        needed = self.size + n
+        if needed <= self.capacity:
+            return
+        capacity = -(-needed // self.chunk) * self.chunk
+        data = np.empty((len(self.fields), capacity), dtype=self.data.dtype)
+        data[:, :self.size] = self.data[:, :self.size]
+        self.data = data
+
+    def extend(self, **values):
+        """
+        Append samples given per field, e.g. extend(time=t, force=f, position=p).
+        Arrays must have the same length, scalars (one stage position per batch)
+        are repeated; every field must be given.
+        """
+        if set(values) != set(self.fields):
+            raise ValueError(f"Expected values for {self.fields}, got {tuple(values)}")
+        lengths = {field: len(v) for field, v in values.items() if np.ndim(v) > 0}
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f"Fields differ in length: {lengths}")
+        n = next(iter(lengths.values()), 1)
+        self._reserve(n)
+        for i, field in enumerate(self.fields):
+            self.data[i, self.size:self.size + n] = values[field]
+        self.size += n
+
+    def view(self, field=None):
+        """Filled part of one field (1-D), or of all of them (fields x samples), without copying"""
+        if field is None:
+            return self.data[:, :self.size]
+        return self.data[self.fields.index(field), :self.size]
+
+    def latest(self, field):
+        """Newest value of a field, None while empty"""
+        return self.data[self.fields.index(field), self.size - 1] if self.size else None
+
+    def clear(self):
+        """Empty the buffer, keeping its memory for the next run"""
+        self.size = 0
@@ -0,0 +1,184 @@
+"""
+Analysis of a finished session in a background process
+
+The GUI starts an AnalysisJob when "Perform Analysis" is pressed, so loading,
+syncing and figure rendering never block the Tk event loop. The worker
+process reports each pipeline stage as it finishes and then either the
+figures folder or the error's traceback over a queue; the GUI drains it with
+poll() from a root.after() callback. cancel() terminates the worker.
+
+A RunPipeline analyses the runs of a session while it is being tested: each
+finished run is handed to its worker, which runs the incremental analysis
+(resample, sync, derivative, per-run metrics stored in the session cache)
+while the next run is acquired, so the session summary is ready seconds
+after the last run.
+"""
+import multiprocessing as mp
+import queue
+import traceback
+from pathlib import Path
+import numpy as np
+
+from eb_analysis import Analysis, FIGURES_DIR
+
+# Text shown as each stage reported by Analysis(progress=...) finishes
+STAGE_LABELS = {'load_runs': "runs loaded and resampled",
+                'synch': "CAP and load cell synced",
+                'derive': "inflection points found",
+                'stats': "statistics computed",
+                'figures': "figures saved"}
+
+def run_analysis(messages, path, sensor_id, sensor_type, kwargs):
+    """
+    Worker process body: analyse the session and save its figures, reporting
+    ('stage', name), then ('done', figures folder) or ('error', traceback)
+    """
+    try:
+        analysis = Analysis(path, sensor_id, sensor_type,
+                            progress=lambda name: messages.put(('stage', name)), **kwargs)
+        analysis.save_figures()
+        messages.put(('done', str(Path(analysis.path) / FIGURES_DIR)))
+    except BaseException:
+        messages.put(('error', traceback.format_exc()))
+
+def session_path(saved_path):
+    """Session folder of a run file folder: the parent of <session>/FUT, otherwise the folder itself"""
+    saved_path = Path(saved_path)
+    return saved_path.parent if saved_path.name == "FUT" else saved_path
+
+def session_summary(result):
+    """One line of the save_data() result: channel averages of the cross-run statistics"""
+    with np.errstate(invalid='ignore'):
+        return (f"{len(result['max_ps'])} runs, P.S at inflection "
+                f"{np.nanmean(result['mean_max_ps']):.3f} pF/kPa "
+                f"(COV {np.nanmean(result['cov_max_ps']):.1%}) "
+                f"at {np.nanmean(result['mean_max_kpa']):.1f} kPa, "
+                f"max CAP {np.nanmean(result['mean_max_cap']):.2f} pF")
+
+def run_pipeline(messages, tasks, path, sensor_id, sensor_type, kwargs):
+    """
+    Worker process body of a RunPipeline: every task analyses the runs saved so
+    far, incrementally so only new runs are processed, and reports ('runs', count).
+    The last task (None) reports ('summary', text) and ('done', None), or ('error', traceback);
+    failures before it are only ('warning', traceback), a later task retries.
+    """
+    final = False
+    while not final:
+        final = tasks.get() is None
+        try:
+            analysis = Analysis(path, sensor_id, sensor_type, incremental=True, headless=True,
+                                **kwargs)
+            result = analysis.save_data()
+        except BaseException:
+            messages.put(('error' if final else 'warning', traceback.format_exc()))
+            continue
+        messages.put(('runs', len(analysis.run_ids)))
+        if final:
+            messages.put(('summary', session_summary(result)))
+            messages.put(('done', None))
+
+class AnalysisJob():
+    """
+    One analysis running in its own process
+
+    The worker is a daemon, so closing the GUI stops it, and it analyses with
+    a single process (workers=1): a daemon cannot start a process pool, and
+    the other cores stay free for the next test's acquisition.
+    """
+    def __init__(self, path, sensor_id, sensor_type=3, **kwargs):
+        """
+        Parameters:
+            path: Session folder, see Analysis
+            sensor_id: Sensor ID
+            sensor_type: See Analysis
+            kwargs: Further Analysis parameters
+        """
+        self.path = path
+        self.sensor_id = sensor_id
+        self.sensor_type = sensor_type
+        self.kwargs = dict(kwargs, workers=1)
+        self.state = 'new' # new, running, done, error or cancelled
+        self.process = None
+        self.messages = None
+
+    def start(self):
+        # spawn: forking a process that has Tk open is unsafe
+        self._start(mp.get_context('spawn'), run_analysis)
+
+    def _start(self, ctx, target, *queues):
+        self.messages = ctx.Queue()
+        self.process = ctx.Process(target=target, daemon=True,
+                                   args=(self.messages, *queues, self.path, self.sensor_id,
+                                         self.sensor_type, self.kwargs))
+        self.process.start()
+        self.state = 'running'
+
+    @property
+    def running(self):
+        return self.state == 'running'
+
+    def poll(self):
+        """
+        Messages received since the last poll, without blocking: ('stage', name),
+        ('done', figures folder) or ('error', text); see run_pipeline for a RunPipeline's
+        """
+        if not self.running:
+            return []
+        received = []
+        while True:
+            try:
+                received.append(self.messages.get_nowait())
+            except queue.Empty:
+                break
+        for kind, _ in received:
+            if kind in ('done', 'error'):
+                self._finish(kind)
+        if self.running and not self.process.is_alive():
+            # The final message may still be in flight when the process has just exited
+            try:
+                kind, payload = self.messages.get(timeout=0.5)
+                received.append((kind, payload))
+            except queue.Empty:
+                kind = 'error'
+                received.append((kind, f"Analysis process exited with code {self.process.exitcode}"))
+            if kind in ('done', 'error'):
+                self._finish(kind)
+        return received
+
+    def cancel(self):
+        """Stop the worker; figures already written are kept"""
+        if self.running:
+            self.process.terminate()
+            self._finish('cancelled')
+
+    def _finish(self, state):
+        self.state = state
+        self.process.join()
+        self.messages.close()
+
+class RunPipeline(AnalysisJob):
+    """
+    Background analysis of a session's runs as they are saved
+
+    submit() after every saved run, finish() after the last one. The worker
+    analyses with Analysis(incremental=True), so each run is processed once
+    and its results are kept in the session cache for the final statistics.
+    """
+    def start(self):
+        ctx = mp.get_context('spawn')
+        self.tasks = ctx.Queue()
+        self._start(ctx, run_pipeline, self.tasks)
+
+    def submit(self):
+        """Analyse the runs saved so far"""
+        if self.running:
+            self.tasks.put('runs')
+
+    def finish(self):
+        """Analyse the remaining runs and report the session summary, then stop"""
+        if self.running:
+            self.tasks.put(None)
+
+    def _finish(self, state):
+        super()._finish(state)
+        self.tasks.close()
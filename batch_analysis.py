@@ -0,0 +1,163 @@
+"""
+Batch analysis of every session under a data root
+
+Sessions are expected as <root>/<sensor_id>/<MM DD YY>_<area>_<test>/{CAP,FUT}.
+Each session is analyzed (headless) in a process pool. Per-channel results
+go into one consolidated CSV table. A manifest next to the table remembers
+the input files and parameters each session was analyzed with, so unchanged
+sessions are skipped on the next run.
+
+Usage:
+    python batch_analysis.py <root> [--workers N] [--sensor-type 3] [--force]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from eb_analysis import Analysis
+import fut_io
+
+MANIFEST_NAME = ".batch_manifest.json"
+SESSION_PATTERN = re.compile(r"^(\d{2}) (\d{2}) (\d{2})_(.+)_([^_]+)$")
+
+# save_data() keys reported per channel in the results table
+RESULT_KEYS = [
+    'mean_max_ps', 'std_max_ps', 'cov_max_ps',
+    'mean_max_kpa', 'std_max_kpa', 'cov_max_kpa',
+    'mean_max_cap', 'std_max_cap', 'max_cap_cov',
+    'mean_inf_cap', 'std_inf_cap', 'cov_inf_cap',
+]
+
+def discover_sessions(root):
+    """Every <sensor_id>/<session> folder under root that has both CAP and FUT data"""
+    sessions = []
+    for cap_dir in sorted(Path(root).glob("*/*/CAP")):
+        session = cap_dir.parent
+        if (session / "FUT").is_dir():
+            sessions.append(session)
+    return sessions
+
+def session_info(session):
+    """Sensor id, date, area and test type from a session path"""
+    info = {'sensor_id': session.parent.name, 'session': session.name,
+            'date': None, 'area': None, 'test': None}
+    match = SESSION_PATTERN.match(session.name)
+    if match:
+        month, day, year, area, test = match.groups()
+        info.update(date=f"20{year}-{month}-{day}", area=area, test=test)
+    return info
+
+def session_fingerprint(session, params):
+    """Hash of the session's run files (name, size, mtime) and the analysis parameters"""
+    h = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    for f in sorted(list((session / "CAP").glob("*.csv")) + fut_io.run_files(session / "FUT")):
+        st = f.stat()
+        h.update(f"{f.relative_to(session)}|{st.st_size}|{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+def analyze_session(session, params):
+    """Analyze one session and return its rows of the results table (one per channel)"""
+    info = session_info(session)
+    analysis = Analysis(session, info['sensor_id'], params['sensor_type'],
+                        use_cache=params['use_cache'], workers=1, headless=True,
+                        sync_mode=params['sync_mode'], nan_policy=params['nan_policy'],
+                        out_of_core=params['out_of_core'], rate=params['rate'])
+    result = analysis.save_data()
+
+    rows = []
+    for j in range(analysis.ch):
+        row = dict(info, channel=j+1, n_runs=analysis.cap_size)
+        for key in RESULT_KEYS:
+            value = result[key][j]
+            row[key] = None if np.isnan(value) else float(value)
+        rows.append(row)
+    return rows
+
+def load_manifest(path):
+    if path.exists():
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable manifest {path}: {e}")
+    return {}
+
+def run_batch(root, out=None, workers=None, force=False, **params):
+    """
+    Analyze every changed session under root and write the consolidated table
+
+    Parameters:
+        root: Data root holding <sensor_id>/<session> folders
+        out: Results CSV, defaults to <root>/batch_results.csv
+        workers: Sessions analyzed in parallel (None = all cores)
+        force: Re-analyze every session, even if unchanged
+        params: sensor_type, sync_mode, nan_policy, rate, use_cache, out_of_core (see Analysis)
+
+    Returns:
+        The results table as a DataFrame
+    """
+    root = Path(root)
+    out = Path(out) if out else root / "batch_results.csv"
+    manifest_path = out.with_name(MANIFEST_NAME)
+    manifest = {} if force else load_manifest(manifest_path)
+    workers = workers or os.cpu_count() or 1
+
+    sessions = discover_sessions(root)
+    # Whether the run file cache or the signal store is used does not change the results
+    result_params = {k: v for k, v in params.items() if k not in ('use_cache', 'out_of_core')}
+    fingerprints = {str(s): session_fingerprint(s, result_params) for s in sessions}
+    todo = [s for s in sessions
+            if manifest.get(str(s), {}).get('fingerprint') != fingerprints[str(s)]]
+    print(f"{len(sessions)} sessions found, {len(sessions) - len(todo)} unchanged, "
+          f"{len(todo)} to analyze")
+
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+        futures = {pool.submit(analyze_session, s, params): s for s in todo}
+        for future in as_completed(futures):
+            session = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                # Leave it out of the manifest so it is retried next time
+                print(f"FAILED {session}: {e}")
+                manifest.pop(str(session), None)
+                continue
+            manifest[str(session)] = {'fingerprint': fingerprints[str(session)], 'rows': rows}
+            print(f"Analyzed {session}")
+
+    # Sessions that no longer exist drop out of the manifest and the table
+    manifest = {s: entry for s, entry in manifest.items() if s in fingerprints}
+    manifest_path.write_text(json.dumps(manifest, indent=1))
+
+    table = pd.DataFrame([row for s in sorted(manifest) for row in manifest[s]['rows']])
+    table.to_csv(out, index=False)
+    print(f"Results written to {out}")
+    return table
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze every sensor session under a data root")
+    parser.add_argument("root", help="folder holding <sensor_id>/<session>/{CAP,FUT}")
+    parser.add_argument("--out", help="results CSV (default: <root>/batch_results.csv)")
+    parser.add_argument("--workers", type=int, help="sessions analyzed in parallel (default: all cores)")
+    parser.add_argument("--sensor-type", type=int, default=3, choices=[1, 3])
+    parser.add_argument("--sync-mode", default='peak', choices=['peak', 'xcorr'])
+    parser.add_argument("--nan-policy", default='propagate', choices=['propagate', 'omit'])
+    parser.add_argument("--rate", type=float, default=200, help="analysis sample rate (Hz)")
+    parser.add_argument("--no-cache", action="store_true", help="re-parse run files instead of using .cache")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="keep each session's signals in a memory-mapped file instead of RAM")
+    parser.add_argument("--force", action="store_true", help="re-analyze unchanged sessions too")
+    args = parser.parse_args()
+
+    run_batch(args.root, out=args.out, workers=args.workers, force=args.force,
+              sensor_type=args.sensor_type, sync_mode=args.sync_mode,
+              nan_policy=args.nan_policy, rate=args.rate, use_cache=not args.no_cache,
+              out_of_core=args.out_of_core)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Benchmark of the analysis pipeline on synthetic sessions
+
+For every session size a synthetic session is written (see synthetic_data)
+and each pipeline stage is timed on its own: file parsing, interpolation to
+the analysis grid, sync, derivative/inflection points, statistics and figure
+rendering. Reports wall time, throughput (raw CAP samples per second) and
+peak traced memory per stage (from a separate, untimed pass), so changes to
+the pipeline can be compared.
+
+Usage:
+    python benchmark.py [--durations 120 600] [--runs 3] [--no-figures] [--no-memory] [--json out.json]
+"""
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+from cap_reader import read_cap
+from eb_analysis import Analysis, correct_ch_order, interp_run
+import fut_io
+import synthetic_data
+
+STAGES = ['load', 'interp', 'sync', 'derive', 'stats', 'plotting']
+
+@contextmanager
+def _measure(report, stage):
+    """Record wall time and peak traced memory (when tracing) of the block under report[stage]"""
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        start_mem = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    peak = (tracemalloc.get_traced_memory()[1] - start_mem) / 2**20 if tracing else None
+    report[stage] = {'seconds': elapsed, 'peak_mb': peak}
+
+def _run_stages(session, workers, figures, dpi, report):
+    """
+    Run every pipeline stage of one session once, each under _measure(report, stage)
+
+    Returns:
+        (raw CAP samples, total seconds)
+    """
+    analysis = Analysis(session, 0, 1, use_cache=False, workers=workers, headless=not figures)
+    n = 0 # raw CAP samples, the throughput unit of every stage
+
+    frames = []
+    start = time.perf_counter()
+    with _measure(report, 'load'):
+        for cap_file, fut_file in zip(analysis.csv_files, analysis.fut_files):
+            cap = read_cap(cap_file, v=analysis.v, ch=analysis.ch)
+            frames.append((correct_ch_order(cap, analysis.ch_order), fut_io.read_run(fut_file)))
+            n += len(cap)
+
+    with _measure(report, 'interp'):
+        results = [interp_run(cap, fut, analysis.ch, analysis.rate) for cap, fut in frames]
+    del frames
+    # Hand the resampled runs to the analysis as if its load stage had produced them
+    analysis._store_runs(results)
+    analysis._stages_done.add('_load_runs')
+    del results
+
+    with _measure(report, 'sync'):
+        analysis._synch()
+    with _measure(report, 'derive'):
+        analysis._derive()
+    with _measure(report, 'stats'):
+        analysis.save_data()
+
+    if figures:
+        with tempfile.TemporaryDirectory() as out:
+            with _measure(report, 'plotting'):
+                analysis.save_figures(dpi=dpi, out_dir=out, force=True)
+    return n, time.perf_counter() - start
+
+def bench_session(session, workers=1, figures=True, dpi=100, memory=True):
+    """
+    Time every pipeline stage on one session
+
+    memory: Also measure the peak memory of each stage. Allocation tracing
+            slows down Python-heavy stages (plotting), so it runs as a second,
+            untimed pass and the timings are never taken with it on
+
+    Returns:
+        {stage: {'seconds', 'samples_per_s', 'peak_mb'}} plus the session's 'cap_samples'
+    """
+    report = {}
+    n, report['total_seconds'] = _run_stages(session, workers, figures, dpi, report)
+
+    if memory:
+        traced = {}
+        tracemalloc.start()
+        try:
+            _run_stages(session, workers, figures, dpi, traced)
+        finally:
+            tracemalloc.stop()
+        for stage in STAGES:
+            if stage in report:
+                report[stage]['peak_mb'] = traced[stage]['peak_mb']
+
+    for stage in STAGES:
+        if stage in report:
+            seconds = report[stage]['seconds']
+            report[stage]['samples_per_s'] = n / seconds if seconds > 0 else None
+    report['cap_samples'] = n
+    return report
+
+def run_benchmark(durations, n_runs=3, workers=1, figures=True, dpi=100, memory=True, root=None,
+                  **run_params):
+    """
+    Benchmark one synthetic session per capture duration
+
+    Parameters:
+        durations: Load cell capture lengths (s) to benchmark
+        n_runs: Runs per session
+        workers: See Analysis
+        figures: Include figure rendering
+        dpi: Resolution of the rendered figures
+        memory: Trace the peak memory of each stage (see bench_session)
+        root: Keep the synthetic sessions here instead of a temporary folder
+        run_params: Passed to synthetic_data.make_run (cap_rate, fut_rate, noise, ...)
+
+    Returns:
+        List of {'duration', 'runs', **bench_session report}
+    """
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for sensor_id, duration in enumerate(durations, start=1):
+            session = synthetic_data.make_session(root or tmp, sensor_id=sensor_id, n_runs=n_runs,
+                                                  duration=duration, **run_params)
+            report = bench_session(session, workers=workers, figures=figures, dpi=dpi,
+                                   memory=memory)
+            reports.append(dict(duration=duration, runs=n_runs, **report))
+            print_report(reports[-1])
+    return reports
+
+def print_report(report):
+    print(f"\n{report['runs']} runs x {report['duration']:g} s "
+          f"({report['cap_samples']} CAP samples), total {report['total_seconds']:.2f} s")
+    print(f"{'stage':<10}{'time (s)':>10}{'samples/s':>14}{'peak (MB)':>11}")
+    for stage in STAGES:
+        if stage in report:
+            r = report[stage]
+            rate = f"{r['samples_per_s']:.3g}" if r['samples_per_s'] else '-'
+            peak = f"{r['peak_mb']:.1f}" if r['peak_mb'] is not None else '-'
+            print(f"{stage:<10}{r['seconds']:>10.3f}{rate:>14}{peak:>11}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline on synthetic sessions")
+    parser.add_argument("--durations", type=float, nargs="+", default=[120, 600],
+                        help="load cell capture length of each benchmarked session (s)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--cap-rate", type=float, default=98.4, help="CAP sample rate (Hz)")
+    parser.add_argument("--fut-rate", type=float, default=62.5, help="load cell sample rate (Hz)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-figures", action="store_true", help="skip figure rendering")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the untimed allocation tracing pass for the peak memory")
+    parser.add_argument("--keep", help="write the synthetic sessions here and keep them")
+    parser.add_argument("--json", help="also write the reports to this file")
+    args = parser.parse_args()
+
+    reports = run_benchmark(args.durations, n_runs=args.runs, workers=args.workers,
+                            figures=not args.no_figures, dpi=args.dpi,
+                            memory=not args.no_memory, root=args.keep,
+                            cap_rate=args.cap_rate, fut_rate=args.fut_rate)
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=1))
+        print(f"\nReports written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Reader for the capacitance (CAP) csv files exported by the sensor app
+
+Each file has a 26 column header, one interstitial metadata row (session
+id, start time, ...) with no sample values, then one row per sample with a
+wall clock string, battery, accelerometer and empty metadata columns.
+Only the elapsed time and the capacitance channels are used by the
+analysis, so only those columns are parsed.
+"""
+import numpy as np
+import pandas as pd
+
+# Metadata columns reported by read_cap_header
+HEADER_COLUMNS = ['session_id', 'session_start_time', 'patient_id', 'patient_notes',
+                  'procedure_description', 'procedure_sensor_placement',
+                  'procedure_series', 'procedure_notes']
+
+def read_cap(f, v=5, ch=8, dtype=np.float64, chunksize=None):
+    """
+    Parse the elapsed time and capacitance channels of a CAP csv
+
+    Parameters:
+        f: CAP csv file
+        v: Column of the first capacitance channel (PCB Board Version: v2 = 2 | v3 = 5)
+        ch: Number of capacitance channels
+        dtype: np.float64, or np.float32 to halve the memory of long captures.
+               Applies to the channels; the elapsed time is always float64
+        chunksize: Parse this many rows at a time instead of the whole file at once
+
+    Returns:
+        DataFrame of (time, ch1, ..., chN) with the metadata rows removed
+    """
+    usecols = [0] + list(range(v, v + ch))
+    header = pd.read_csv(f, nrows=0).columns
+    # float32 time would lose sub-ms resolution within the first hour of a capture
+    dtypes = {header[i]: np.float64 if i == 0 else dtype for i in usecols}
+    reader = pd.read_csv(f, usecols=usecols, dtype=dtypes, engine='c',
+                         chunksize=chunksize)
+    chunks = [reader] if chunksize is None else reader
+
+    times, blocks = [], []
+    for chunk in chunks:
+        # Rows without an elapsed time are session metadata, not samples
+        time = chunk.iloc[:, 0].to_numpy(dtype=np.float64)
+        keep = ~np.isnan(time)
+        times.append(time[keep])
+        blocks.append(chunk.iloc[:, 1:].to_numpy(dtype=dtype)[keep])
+        columns = chunk.columns
+    data = pd.DataFrame(np.concatenate(blocks), columns=columns[1:], copy=False)
+    data.insert(0, columns[0], np.concatenate(times))
+    return data
+
+def read_cap_header(f):
+    """
+    Session metadata of a CAP csv, read from its interstitial metadata row
+
+    Returns:
+        dict with the non-empty HEADER_COLUMNS, e.g. session_id and session_start_time
+    """
+    # The metadata row sits right under the column names
+    rows = pd.read_csv(f, nrows=3, dtype=str)
+    header = {}
+    for _, row in rows.iterrows():
+        if pd.isna(row.iloc[0]):
+            for name in HEADER_COLUMNS:
+                if name in row.index and not pd.isna(row[name]):
+                    header[name] = row[name]
+            break
+    return header
@@ -1,16 +1,267 @@
 from pathlib import Path
+import os
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 from scipy import interpolate
-import copy
-import matplotlib.pyplot as plt
+from scipy import fft
 
-from scipy.signal import find_peaks
+from scipy.signal import find_peaks, resample_poly
 from scipy.ndimage import uniform_filter1d
 import pickle
+from run_cache import RunCache
+from cap_reader import read_cap, read_cap_header
+from signal_store import SignalStore
+import fut_io
+from incremental import RunStore, params_key
+from eb_stats import mean_std_cov, channel_variability, CHANNEL_GROUPS
+import figures
+from stage_profiler import StageProfiler, profile_mode
+
+# Time constants of the analysis, in seconds so they hold at any analysis rate
+# (the sample counts in brackets are at the default 200 Hz)
+SMOOTH_WINDOW = 0.5  # moving average of the P.S curves (100 samples)
+PEAK_WIDTH = 1.5     # minimum width of the 1st derivative peak (300 samples)
+END_TRIM = 2.5       # dropped before the FUT maximum, where the force drops off (500 samples)
+
+FIGURES_DIR = "figures" # save_figures() output, inside the session folder
+
+def stage(func):
+    """
+    Mark an Analysis method as a pipeline stage: it runs on first call only,
+    later calls are free. Stages call the stages they depend on first.
+    Each run of a stage is measured by the analysis' profiler (if enabled)
+    and reported to its progress callback once done.
+    """
+    @functools.wraps(func)
+    def wrapper(self):
+        if func.__name__ not in self._stages_done:
+            with self.profiler.measure(func.__name__.lstrip('_')):
+                func(self)
+            self._stages_done.add(func.__name__)
+            if self.progress is not None:
+                self.progress(func.__name__.lstrip('_'))
+    return wrapper
+
+def correct_ch_order(df, ch_order):
+    """Reorder the CAP channels of a (time, ch1, ..., chN) frame according to sensor configuration"""
+    return df.iloc[:, [0] + list(ch_order)]
+
+def interp_columns(x_new, x, block):
+    """
+    Linearly interpolate every column of block (samples x channels) from x onto x_new.
+
+    Same result as calling np.interp once per column (values outside x are held at
+    the end samples), but the bracketing indices and weights are found once and
+    shared by all channels.
+    """
+    n = len(x)
+    if n == 1:
+        return np.repeat(block[:1], len(x_new), axis=0)
+
+    # Index of the sample at or before each new point, kept inside [0, n-2]
+    idx = np.clip(np.searchsorted(x, x_new, side='right') - 1, 0, n - 2)
+    dx = x[idx + 1] - x[idx]
+    w = np.divide(x_new - x[idx], dx, out=np.zeros(len(x_new)), where=dx != 0)
+    np.clip(w, 0, 1, out=w)
+
+    lo = block[idx]
+    out = block[idx + 1] - lo
+    out *= w[:, None]
+    out += lo
+    return out
+
+def resample_columns(x_new, x, block, rate):
+    """
+    Resample block (samples, or samples x channels) taken at times x onto the
+    uniform grid x_new of the analysis rate.
+
+    Inputs sampled at or below rate are linearly interpolated. Faster inputs
+    would alias, so they are interpolated onto a grid at an integer multiple of
+    rate (no slower than the input) and decimated with an anti-aliasing
+    polyphase filter.
+    """
+    fs_in = (len(x) - 1) / (x[-1] - x[0]) if len(x) > 1 and x[-1] > x[0] else 0
+    factor = int(np.ceil(fs_in / rate))
+    if factor < 2:
+        if block.ndim == 1:
+            return np.interp(x_new, x, block)
+        return interp_columns(x_new, x, block)
+
+    fine = x_new[0] + np.arange(len(x_new) * factor) / (rate * factor)
+    dense = interp_columns(fine, x, block.reshape(len(x), -1))
+    out = resample_poly(dense, 1, factor, axis=0, padtype='line')[:len(x_new)]
+    return out.reshape((len(x_new),) + block.shape[1:])
+
+def interp_run(cap, fut, ch, rate=200):
+    """Resample one run's CAP channels and FUT force to the analysis rate (Hz)"""
+    # Adjust Futek Time
+    time_col = fut.iloc[:, 2]
+    
+    if pd.api.types.is_datetime64_any_dtype(time_col):
+        time_diffs = time_col.diff()
+        elapsed = time_diffs.fillna(pd.Timedelta(0)).cumsum().dt.total_seconds()
+    else:
+        elapsed = np.concatenate([[0], np.cumsum(np.diff(time_col))])
+    
+    elapsed = np.array(elapsed)
+    fut_force = fut.iloc[:, 1].to_numpy(dtype=float)
+
+    # Real per-reading timestamps can repeat or step back (clock jitter), keep
+    # only readings later than every one before them so time is increasing
+    keep = elapsed > np.maximum.accumulate(np.concatenate([[-np.inf], elapsed[:-1]]))
+    if not keep.all():
+        elapsed, fut_force = elapsed[keep], fut_force[keep]
+    
+    # Pull time and all channels out of pandas once: (samples x channels) block
+    # (the reader already dropped the metadata rows without a time)
+    cap_time_clean = cap.iloc[:, 0].to_numpy(dtype=float)
+    cap_block = cap.iloc[:, 1:1 + ch].to_numpy(dtype=float)
+
+    # Subtract baseline (first valid row) from every channel at once
+    cap_block = cap_block - cap_block[0]
+    
+    # Create time vectors at the analysis rate using cleaned time
+    step = 1 / rate
+    t_c = np.arange(0, cap_time_clean[-1] + step, step)
+    t_f = np.arange(0, elapsed[-1] + step, step)
+    
+    # Resample all CAP channels in one pass
+    cap_interp = resample_columns(t_c, cap_time_clean, cap_block, rate)
+    
+    # Resample FUT
+    fut_interp = resample_columns(t_f, elapsed, fut_force, rate)
+
+    return t_c, t_f, cap_interp, fut_interp
+
+def prepare_run(cap_file, fut_file, run_cache, ch_order, ch, v, cap_dtype='float64', chunksize=None,
+                run=None, profile=False, rate=200):
+    """
+    Load, clean and interpolate a single run. Runs are independent of each
+    other, so this is the unit of work handed to the process pool. Only the
+    resampled arrays are returned, the parsed frames are released here.
+
+    Returns:
+        ((t_c, t_f, cap_interp, fut_interp), profiler records of this run)
+    """
+    profiler = StageProfiler(profile)
+    with profiler.measure('parse', run=run):
+        reader = functools.partial(read_cap, v=v, ch=ch, dtype=cap_dtype, chunksize=chunksize)
+        cap = correct_ch_order(run_cache.load(cap_file, reader, variant=f"v{v}|ch{ch}|{cap_dtype}"),
+                               ch_order)
+        fut = run_cache.load(fut_file, fut_io.read_run)
+    with profiler.measure('interp', run=run):
+        arrays = interp_run(cap, fut, ch, rate)
+    return arrays, profiler.records
+
+def xcorr_lags(cap_traces, fut_traces):
+    """
+    Lag (in samples, sub-sample resolution) of each CAP trace relative to its
+    FUT trace, from the peak of their FFT cross-correlation.
+
+    All runs are zero-padded to one FFT length and correlated in a single
+    batched rfft/irfft, O(n log n) per run. A positive lag means the CAP
+    trace is late, the same sign as the offset of the peak sync mode.
+    """
+    len_c = np.array([len(c) for c in cap_traces])
+    len_f = np.array([len(f) for f in fut_traces])
+    n_fft = fft.next_fast_len(int(np.max(len_c + len_f)) - 1)
+
+    # Reference each trace to its first sample so the zero padding matches the
+    # resting level (no bias towards small lags), and scale to unit peak
+    cap_block = np.zeros((len(cap_traces), n_fft))
+    fut_block = np.zeros((len(fut_traces), n_fft))
+    for block, traces in ((cap_block, cap_traces), (fut_block, fut_traces)):
+        for i, trace in enumerate(traces):
+            trace = trace - trace[0]
+            block[i, :len(trace)] = trace / (np.max(np.abs(trace)) or 1)
+
+    spectrum = fft.rfft(cap_block, axis=1)
+    spectrum *= np.conj(fft.rfft(fut_block, axis=1))
+    corr = fft.irfft(spectrum, n_fft, axis=1)
+
+    # Circular index j holds lag j for j < len_c and lag j - n_fft for the tail
+    j = np.arange(n_fft)
+    valid = (j < len_c[:, None]) | (j > n_fft - len_f[:, None])
+    corr[~valid] = -np.inf
+    peak = np.argmax(corr, axis=1)
+
+    lags = np.where(peak < len_c, peak, peak - n_fft).astype(float)
+    for i, p in enumerate(peak):
+        # Parabolic fit through the peak and its neighbours for the sub-sample part
+        y0, y1, y2 = corr[i, (p - 1) % n_fft], corr[i, p], corr[i, (p + 1) % n_fft]
+        denom = y0 - 2*y1 + y2
+        if np.isfinite(y0) and np.isfinite(y2) and denom < 0:
+            lags[i] += 0.5 * (y0 - y2) / denom
+    return lags
+
+def increment_lookup(x, targets, tol=2.0):
+    """
+    Index of the sample of x closest to each target, or -1 where none is within tol.
+
+    Picks the same sample as np.argmin(np.abs(x - target)) for every target
+    (first index on ties), but x is sorted once and all targets are located with
+    a single searchsorted, so a 1 kPa grid costs about the same as a 5 kPa one.
+    """
+    targets = np.asarray(targets, dtype=float)
+    order = np.argsort(x, kind='stable') # equal values keep their original order
+    xs = x[order]
+    pos = np.searchsorted(xs, targets, side='left')
+
+    # Candidates: the closest value below the target (first of its run of equal
+    # values) and the closest value at or above it
+    lo = np.searchsorted(xs, xs[np.clip(pos - 1, 0, len(xs) - 1)], side='left')
+    hi = np.clip(pos, 0, len(xs) - 1)
+    d_lo = np.abs(xs[lo] - targets)
+    d_hi = np.abs(xs[hi] - targets)
+    pick_hi = (d_hi < d_lo) | ((d_hi == d_lo) & (order[hi] < order[lo]))
+
+    idx = np.where(pick_hi, order[hi], order[lo])
+    return np.where(np.minimum(d_lo, d_hi) < tol, idx, -1)
+
+def _max_peak(fir_dev, width=300):
+    """Index of the highest derivative peak (prominence 0.08, at least width samples wide), or None"""
+    peaks, properties = find_peaks(fir_dev, prominence=0.08, width=width)
+    if len(peaks) == 0:
+        return None
+    return peaks[np.argmax(fir_dev[peaks])]
+
+def _shifted_block(t, data, start, n, rate=200):
+    """
+    Build the synced (n x 1+channels) block [time, data] from samples
+    start:start+n, with time shifted back by the start offset. This is the
+    only copy the sync stage makes of a run's signals.
+    """
+    block = np.empty((n, 1 + (data.shape[1] if data.ndim > 1 else 1)))
+    block[:, 0] = t[start:start + n]
+    block[:, 0] -= start * (1/rate)
+    if data.ndim > 1:
+        block[:, 1:] = data[start:start + n]
+    else:
+        block[:, 1] = data[start:start + n]
+    return block
+
+def _ordered_results(pool, func, jobs, window):
+    """
+    func(*job) of each job from the pool, in job order, with at most window
+    jobs submitted and not yet handed on, so finished results cannot pile up
+    """
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.submit(func, *job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
 class Analysis():
-    def __init__(self, path, sensor_id, sensor_type):
+    def __init__(self, path, sensor_id, sensor_type, use_cache=True, workers=None,
+                 headless=False, sync_mode='peak', sync_channel=None, pressure_grid=None,
+                 channel_groups=None, nan_policy='propagate', runs=None, incremental=False,
+                 cap_dtype='float64', chunksize=None, out_of_core=False, profile=None, rate=200,
+                 progress=None):
         """
         Initialize Analysis with parameters
         
@@ -18,11 +269,43 @@ class Analysis():
             path: Path to data directory
             sensor_id: Sensor ID number
             sensor_type: 1 or 3 (2 is archived)
+            use_cache: Reuse parsed run files from <path>/.cache when unchanged
+            workers: Processes used to load/interpolate runs and render figures
+                     in parallel (None = all cores, 1 = everything in this process)
+            headless: Numbers-only analysis, save_figures() renders nothing
+            sync_mode: 'peak' aligns the CAP and FUT maxima sample by sample,
+                       'xcorr' uses the FFT cross-correlation lag (sub-sample)
+            sync_channel: CAP channel (0-7) correlated in 'xcorr' mode,
+                          None = mean of the non-shorted channels
+            pressure_grid: Pressures (kPa) for the incremental CAP values,
+                           None = every 5 kPa from 5 to 45 kPa
+            channel_groups: {name: channel indices} for the CH variability stats,
+                            None = center4, outer4 and allch
+            nan_policy: 'propagate' or 'omit' NaNs (e.g. channels without an
+                        inflection point) in the save_data() statistics
+            runs: 0-based indices of the runs to analyze, None = every run in the session
+            incremental: Keep per-run results and running statistics in <path>/.cache so
+                         save_data() only processes runs that are new or changed
+            cap_dtype: 'float64', or 'float32' to halve the memory of the parsed CAP channels
+                       (their elapsed time stays float64)
+            chunksize: Parse CAP files this many rows at a time (long captures), None = at once
+            out_of_core: Keep the resampled, synced and smoothed signals in a memory-mapped
+                         file in <path>/.cache instead of RAM (long sessions, batch runs)
+            profile: Record wall/CPU time per stage and per run (True), plus traced memory
+                     allocations ('memory'); None = EB_ANALYSIS_PROFILE environment variable.
+                     See profile_report()
+            rate: Analysis sample rate (Hz) the runs are resampled to; sync offsets and
+                  the smoothing/peak windows follow it. Faster inputs are decimated
+            progress: Called with the stage name ('load_runs', 'synch', 'derive', 'stats',
+                      'figures') as each stage finishes
         """
         # Store parameters
         self.sensor_id = sensor_id
         self.path = Path(path) # this is because Path(path) is in fut folder
         self.sensor_type = sensor_type
+        self.run_cache = RunCache(self.path, enabled=use_cache)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.headless = headless
         print(self.path)
         
         # Initialize channel order based on sensor type
@@ -33,36 +316,71 @@ class Analysis():
         else:
             raise ValueError(f"Invalid sensor_type: {sensor_type}")
 
+        if sync_mode not in ('peak', 'xcorr'):
+            raise ValueError(f"Invalid sync_mode: {sync_mode}")
+        self.sync_mode = sync_mode
+        self.sync_channel = sync_channel
+
         # Define paths and get file lists
         self.cap_path = Path(path) / "CAP"
         self.fut_path = Path(path) / "FUT"
 
-        csv_files = sorted(self.cap_path.glob("*.csv"))
-        xlsx_files = sorted(self.fut_path.glob("*.xlsx"))
-        self.cap_size = len(csv_files)
-
-        # Load data
-        self.cap, self.fut = self._create_data(csv_files, xlsx_files)
+        self.csv_files = sorted(self.cap_path.glob("*.csv"))
+        self.fut_files = fut_io.run_files(self.fut_path) # Run N.csv, or Run N.xlsx
+        self.run_ids = list(range(min(len(self.csv_files), len(self.fut_files))))
+        if runs is None:
+            # A run needs both files: drop CAP or FUT files without a partner
+            self.csv_files = self.csv_files[:len(self.run_ids)]
+            self.fut_files = self.fut_files[:len(self.run_ids)]
+        else:
+            self.run_ids = [self.run_ids[r] for r in runs]
+            self.csv_files = [self.csv_files[r] for r in runs]
+            self.fut_files = [self.fut_files[r] for r in runs]
+        self.cap_size = len(self.csv_files)
+        self.subset = runs is not None # only some of the session's runs are analyzed
+        self.incremental = incremental
 
         # Define pressure parameters
         self.start_force = 0  # kPa
         self.end_force = 45  # kPa
+        # Pressures at which CAP is sampled along the P.S curve
+        if pressure_grid is None:
+            pressure_grid = np.arange(5, self.end_force + 5, 5) # 5, 10, ..., 45 kPa
+        self.pressure_grid = np.asarray(pressure_grid, dtype=float)
+        self.channel_groups = channel_groups if channel_groups is not None else CHANNEL_GROUPS
+        if nan_policy not in ('propagate', 'omit'):
+            raise ValueError(f"Invalid nan_policy: {nan_policy}")
+        self.nan_policy = nan_policy
         
         self.ch = 8  # number of channels in sensor
         self.v = 5   # PCB Board Version: v2 = 2 | v3 = 5
 
         self.SA = 325e-6  # Eco Blox surface area (325mm2)
 
-        # Correct channel order
-        self.cap = self._correct_ch_order(self.cap)
+        if not rate > 0:
+            raise ValueError(f"Invalid rate: {rate}")
+        self.rate = rate
+        # Windows in samples at this rate
+        self.smooth_size = max(1, round(SMOOTH_WINDOW * rate))
+        self.peak_width = max(1, round(PEAK_WIDTH * rate))
+        self.end_trim = round(END_TRIM * rate)
+
+        if cap_dtype not in ('float64', 'float32'):
+            raise ValueError(f"Invalid cap_dtype: {cap_dtype}")
+        self.cap_dtype = cap_dtype
+        self.chunksize = chunksize
+        self.out_of_core = out_of_core
+        self.signal_store = None # created by the first _keep() when out_of_core
 
         # Initialize storage lists
+        # (the parsed CAP/FUT frames are not kept, only their resampling in self.run)
         self.run = []
         self.t_c = []
         self.t_f = []
         self.test = []
         self.c = np.zeros((self.cap_size, self.ch))
         self.shorted_ch = None
+        self.shorted_chs = []
 
         self.zaber_x = []
         self.zaber_y = []
@@ -79,495 +397,366 @@ class Analysis():
         self.max_kPa_numeric = np.zeros((self.cap_size, self.ch))
         self.inf_CAP_numeric = np.zeros((self.cap_size, self.ch))
 
-        # Run the analysis pipeline
-        self._interp_cap()
-        self._synch_and_plot()
-        self._derive_and_plot()
-        self._plot_all_chs_across_runs()
-        self._plot_all_runs_across_chs()
-
-    def _create_data(self, csv_files, xlsx_files):
-        """Load CAP and FUT data from files"""
-        cap = []
-        fut = []
-
-        for f in csv_files:
-            cap.append(pd.read_csv(f, usecols=range(16)))
-
-        for f in xlsx_files:
-            fut.append(pd.read_excel(f))
-        
-        return cap, fut
-
-    def _correct_ch_order(self, cap):
-        """Reorder channels according to sensor configuration"""
-        reordered_cap = []
-
-        cols = (
-            list(range(0, 5)) +
-            list(self.ch_order + self.v - 1) +
-            list(range(13, 16))
-        )
+        # Nothing is computed up front. The pipeline stages
+        # (load/resample -> sync -> derive -> stats) run on demand from
+        # save_data() and save_figures(), each at most once.
+        self.result = None
+        self._stages_done = set()
+        self.profiler = StageProfiler(profile_mode(profile))
+        self.progress = progress
+
+    @stage
+    def _load_runs(self):
+        """Load CAP and FUT data from files and resample them to the analysis rate"""
+        jobs = [(cap_file, fut_file, self.run_cache, self.ch_order, self.ch, self.v,
+                 self.cap_dtype, self.chunksize, run, self.profiler.mode, self.rate)
+                for cap_file, fut_file, run in zip(self.csv_files, self.fut_files, self.run_ids)]
+
+        n_workers = min(self.workers, len(jobs))
+        if n_workers > 1:
+            # Results come back in submission order, so run i stays run i. One job per
+            # worker is in flight, the next is submitted once the oldest is stored
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                self._store_runs(self._run_arrays(
+                    _ordered_results(pool, prepare_run, jobs, n_workers)))
+        else:
+            self._store_runs(self._run_arrays(prepare_run(*job) for job in jobs))
 
-        for df in cap:
-            reordered_cap.append(df.iloc[:, cols])
+    def _run_arrays(self, results):
+        """Pass on the arrays of each prepare_run result, keeping its profiler records"""
+        for arrays, records in results:
+            self.profiler.extend(records)
+            yield arrays
 
-        return reordered_cap
+    def _store_runs(self, results):
+        """
+        Keep each resampled run as it arrives. With the pool at most one run per
+        worker is held in this process before it is stored (see _ordered_results)
+        """
+        for i, (t_c_i, t_f_i, cap_interp, fut_interp) in enumerate(results):
+            self.t_c.append(self._keep(f'run{i}_t_c', t_c_i))
+            self.t_f.append(self._keep(f'run{i}_t_f', t_f_i))
+            self.run.append([self._keep(f'run{i}_cap', cap_interp),
+                             self._keep(f'run{i}_fut', fut_interp)])
+
+    def _keep(self, name, arr):
+        """Hold a signal array in the signal store when out_of_core, otherwise as is"""
+        if not self.out_of_core:
+            return arr
+        if self.signal_store is None:
+            self.signal_store = SignalStore(self.run_cache.cache_path)
+        return self.signal_store.put(name, arr)
+
+    def cap_headers(self):
+        """Session metadata (session_id, session_start_time, ...) of each run's CAP file"""
+        return [read_cap_header(f) for f in self.csv_files]
+
+    def fut_info(self):
+        """Wall clock anchor and timing of each run's FUT file, None where not recorded"""
+        return [fut_io.read_run_info(f) for f in self.fut_files]
+
+    @stage
+    def _synch(self):
+        """Sync CAP and FUT data by aligning peaks"""
+        self._load_runs()
 
-    def _interp_cap(self):
-        """Interpolate CAP and FUT data to 200 Hz"""
+        # Exclude shorted channel(s) when identifying the CAP trace to sync FUT data.
+        # Only the per-channel maxima are masked, the signals themselves are untouched
+        sync_chan = []
+        healthy_chs = []
         for i in range(self.cap_size):
-            # Adjust Futek Time
-            time_col = self.fut[i].iloc[:, 2]
-            
-            if pd.api.types.is_datetime64_any_dtype(time_col):
-                time_diffs = time_col.diff()
-                elapsed = time_diffs.fillna(pd.Timedelta(0)).cumsum().dt.total_seconds()
-            else:
-                elapsed = np.concatenate([[0], np.cumsum(np.diff(time_col))])
-            
-            elapsed = np.array(elapsed)
-            
-            # There is NaN values in the CAP time column, which mess up the interpolation
-            # We need to remove these NaN values before interpolation
-            cap_time = self.cap[i].iloc[:, 0].values
-            valid_mask = ~np.isnan(cap_time)  # Boolean mask of non-NaN values
-            
-            cap_time_clean = cap_time[valid_mask]
-            
-            # Create time vectors at 200 Hz using cleaned time
-            t_c_i = np.arange(0, cap_time_clean[-1] + 0.005, 0.005)
-            t_f_i = np.arange(0, elapsed[-1] + 0.005, 0.005)
-            
-            self.t_c.append(t_c_i)
-            self.t_f.append(t_f_i)
-            
-            # Interpolate CAP for each channel
-            cap_interp = np.zeros((len(t_c_i), self.ch))
-            
-            for j in range(self.ch):
-                col_idx = j + self.v
-                
-                # Get capacitance data and remove corresponding NaN indices
-                cap_data = self.cap[i].iloc[:, col_idx].values
-                cap_data_clean = cap_data[valid_mask]  # Use same mask as time
-                
-                # Subtract baseline (first valid value)
-                baseline = cap_data_clean[0]
-                cap_data_clean = cap_data_clean - baseline
-                
-                # Interpolate with cleaned data
-                cap_interp[:, j] = np.interp(
-                    t_c_i,                  # New time grid
-                    cap_time_clean,         # Cleaned original time
-                    cap_data_clean          # Cleaned capacitance data
-                )
-            
-            # Interpolate FUT
-            fut_interp = np.interp(t_f_i, elapsed, self.fut[i].iloc[:, 1])
-            
-            # Store results
-            self.run.append([cap_interp, fut_interp])
+            # Find maximum point which corresponds to when Futek released pressure from sensor (Inflection)
+            max_per_channel = np.max(self.run[i][0], axis=0) # returns row vector of 8 channels
+            self.shorted_ch = np.where(max_per_channel > 10)[0]  # Find channels where max > 10
+            self.shorted_chs.append(self.shorted_ch)
+            max_per_channel[self.shorted_ch] = 0
+            healthy_chs.append(np.setdiff1d(np.arange(self.ch), self.shorted_ch))
 
-    def _synch_and_plot(self):
-        """Sync CAP and FUT data by aligning peaks"""
-        temp_run = copy.deepcopy(self.run)
+            # identify channel with the highest change in capacitance - sync signals based on this channel
+            sync_chan.append(np.argmax(max_per_channel))  # Channel with highest max
+
+        if self.sync_mode == 'xcorr':
+            # Correlate force against the chosen channel, or the mean of the healthy channels
+            cap_traces = []
+            for i in range(self.cap_size):
+                if self.sync_channel is not None:
+                    cap_traces.append(self.run[i][0][:, self.sync_channel])
+                else:
+                    cap_traces.append(np.mean(self.run[i][0][:, healthy_chs[i]], axis=1))
+            lags = xcorr_lags(cap_traces, [run[1] for run in self.run])
         
         for i in range(self.cap_size):
-            # Find maximum point which corresponds to when Futek released pressure from sensor (Inflection)
-            temp_max_cap = np.max(temp_run[i][0], axis=0) # returns row vector of 8 channels
-            self.shorted_ch = np.where(temp_max_cap > 10)[0]  # Find channels where max > 10
+            with self.profiler.measure('synch', run=self.run_ids[i]):
+                self._synch_run(i, sync_chan[i], lags[i] if self.sync_mode == 'xcorr' else None)
 
-            # Exclude shorted channel(s) when identifying max CH to sync FUT data
-            temp_run[i][0][:,self.shorted_ch] = 0
-
-            # identify channel with the highest change in capacitance - sync signals based on this channel
-            max_per_channel = np.max(temp_run[i][0], axis=0)
-            chan = np.argmax(max_per_channel)  # Channel with highest max
+    def _synch_run(self, i, sync_chan, lag=None):
+        """
+        Sync and trim run i: shift the later of CAP and FUT back by the offset
+        between the FUT maximum and the sync channel's maximum ('peak'), or by
+        the cross-correlation lag in samples ('xcorr')
+        """
+        cap_i, fut_i = self.run[i]
+
+        # Find location of maximum values
+        loc_f = np.argmax(fut_i)  # Index of max for FUT
+
+        if self.sync_mode == 'xcorr':
+            # Whole samples are trimmed off the late signal, the fraction
+            # is applied by re-interpolating it onto a shifted grid
+            start = int(np.floor(abs(lag)))
+            frac = abs(lag) - start
+            if lag > 0:
+                start_c, start_f = start, 0
+                if frac:
+                    cap_i = interp_columns(self.t_c[i] + frac/self.rate, self.t_c[i], cap_i)
+            else:
+                start_c, start_f = 0, start
+                if frac:
+                    fut_i = np.interp(self.t_f[i] + frac/self.rate, self.t_f[i], fut_i)
+        else:
+            loc_c = np.argmax(cap_i[:, sync_chan])  # Index of max for the sync channel
 
-            # Find location of maximum values
-            loc_c = np.argmax(self.run[i][0], axis=0)  # Index of max for each channel
-            loc_f = np.argmax(self.run[i][1])  # Index of max for FUT
-            M = self.run[i][1][loc_f]  # Max value of FUT
-            
             # Calculate offset (number of data points to offset by)
-            offset = int((self.t_c[i][loc_c[chan]] - self.t_f[i][loc_f]) * 200)
+            offset = int((self.t_c[i][loc_c] - self.t_f[i][loc_f]) * self.rate)
 
             if offset > 0:
                 # CAP starts after FUT - shift CAP backward
-                timec = self.t_c[i][offset:]-(offset*(1/200))
-                caps = self.run[i][0][offset:, :]
-
-                # Trim to loc_f to ensure same length:
-                # Use loc_f to ensure that data points are exactly 
-                # the same length between cap and force
-                test_cap = np.column_stack([timec[:loc_f], caps[:loc_f, :]])
-
-                timef = self.t_f[i][:]
-                futs = self.run[i][1][:]
-
-                # Normalize by surface area and convert to kPa
-                test_fut = np.column_stack([timef[:loc_f], futs[:loc_f] / self.SA / 1000])    
-
+                start_c, start_f = offset, 0
             else:
+                start_c, start_f = 0, abs(offset)
 
-                offset = abs(offset)
-                timec = self.t_c[i][:]
-                caps = self.run[i][0][:,:]  
-                test_cap = np.column_stack([timec[:loc_f], caps[:loc_f, :]])
-                
-                timef = self.t_f[i][offset:]-(offset*(1/200))
-                futs = self.run[i][1][offset:]
-                test_fut = np.column_stack([timef[:loc_f], futs[:loc_f] / self.SA / 1000])   
+        self.c[i,:] = np.max(cap_i[start_c:], axis=0) # finding max CAP of all channels
 
-            self.c[i,:] = np.max(caps, axis=0) # finding max CAP of all channels
+        # Trim to loc_f to ensure same length:
+        # Use loc_f to ensure that data points are exactly 
+        # the same length between cap and force
+        ### Remove end portion (END_TRIM, 500 data points at 200 Hz) from test data to combat
+        ### instances where the last data points include the drop off values
+        n_c = max(min(loc_f, len(self.t_c[i]) - start_c) - self.end_trim, 0)
+        n_f = max(min(loc_f, len(self.t_f[i]) - start_f) - self.end_trim, 0)
 
-            ### Remove end portion (500 data points) from test data to combat
-            ### instances where the last data points include the drop off values
-            test_cap = test_cap[:-500, :]
-            test_fut = test_fut[:-500, :]
+        test_cap = _shifted_block(self.t_c[i], cap_i, start_c, n_c, self.rate)
+        test_fut = _shifted_block(self.t_f[i], fut_i, start_f, n_f, self.rate)
 
-            # Store results
-            self.test.append([test_cap, test_fut])
+        # Normalize by surface area and convert to kPa
+        test_fut[:, 1] /= self.SA
+        test_fut[:, 1] /= 1000
 
-            # Plot the Raw Signal of All Channels and Runs
+        # Store results
+        self.test.append([self._keep(f'run{i}_test_cap', test_cap),
+                          self._keep(f'run{i}_test_fut', test_fut)])
+
+    def _raw_signal_figures(self):
+        """Figure jobs for the Raw Signal of All Channels and Runs"""
+        self._synch()
+        jobs = []
+        for i in range(self.cap_size):
+            test_cap, test_fut = self.test[i]
             for j in range(self.ch):
-                fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(10, 12))
-
-                # Subplot 1: CAP vs Time
-                ax1.plot(self.test[i][0][:, 0], self.test[i][0][:, j+1])
-                ax1.set_ylabel('Change in CAP (pF)', fontsize=12)
-                ax1.set_xlabel('Time (s)', fontsize=12)
-                ax1.set_title(f'Raw Signal - Run #{i+1} - CH{j+1}', fontsize=14, fontweight='bold')
-                ax1.grid(True, alpha=0.3)
-
-                # Subplot 2: Force vs Time
-                ax2.plot(self.test[i][1][:, 0], self.test[i][1][:, 1])
-                ax2.set_ylabel('Force (kPa)', fontsize=12)
-                ax2.set_xlabel('Time (s)', fontsize=12)
-                ax2.grid(True, alpha=0.3)
-
-                # Subplot 3: CAP vs Force (Hysteresis)
-                ax3.plot(self.test[i][1][:, 1], self.test[i][0][:, j+1])
-                ax3.set_xlabel('Force (kPa)', fontsize=12)
-                ax3.set_ylabel('Change in CAP (pF)', fontsize=12)
-                ax3.grid(True, alpha=0.3)
-
-                # Link x-axes of first two subplots
-                ax1.sharex(ax2)
-                # Adjust layout to prevent overlap
-                plt.tight_layout()
-
-                # Save figure
-                filename = f'Raw Signal_Run #{i+1}_CH{j+1}.png'
-                plt.savefig(filename, dpi=300, bbox_inches='tight')
-                
-                # Close figure to free memory
-                plt.close(fig)
-
-    def _derive_and_plot(self):
+                jobs.append((figures.raw_signal, dict(
+                    filename=f'Raw Signal_Run #{i+1}_CH{j+1}',
+                    run=i+1, ch=j+1,
+                    time_c=test_cap[:, 0], cap=test_cap[:, j+1],
+                    time_f=test_fut[:, 0], force=test_fut[:, 1])))
+        return jobs
+
+    @stage
+    def _derive(self):
         """Determine 1st derivative and incremental points on the P.S Curve"""
+        self._synch()
         # Iterate through each Run
         for i in range(self.cap_size):
-            # Create fig with all channels
-            fig = plt.figure(figsize=(20, 10))
-
-            # Initial storage for this run
-            zaber_x_i = None
-            zaber_y_i = []
-            fir_dev_i = []
-            valz_i = []
-            locz_i = []
-            max_ps_i = []
-            max_kPa_i = []
-            inf_CAP_i = []
-            cap_inc_i = []
-
-            # Iterate through each Channel
-            for j in range(self.ch):
-                # Find start and end indices based on force thresholds
-                k = np.where(self.test[i][1][:,1] - self.start_force > 0)[0][0]
-                f = np.where(self.test[i][1][:,1] - self.end_force > 0)[0][0]
-
-                x = self.test[i][1][k:f, 1]  # Force data
-                y = self.test[i][0][k:f, j+1]  # CAP data for channel j
-                
-                # Smooth data (using moving average with window=100)
-                st_pt = np.where(x-0 > 0)[0][0]
-
-                # Smooth x and y
-                x_smooth = uniform_filter1d(x[st_pt:], size=100, mode='nearest')
-                y_smooth = uniform_filter1d(y[st_pt:], size=100, mode='nearest')
-
-                # Store smoothed data (x is same for all channels)
-                if zaber_x_i is None:
-                    zaber_x_i = x_smooth
-                zaber_y_i.append(y_smooth)
-
-                # 1st derivative of P.S Curve
-                fir_dev_ij = np.diff(y_smooth) / np.diff(x_smooth)
-
-                ### First round of filter: set values > 1 or < 0 to 0
-                fir_dev_ij[(fir_dev_ij > 1) | (fir_dev_ij < 0)] = 0
-
-                # Find peaks in first derivative
-                peaks, properties = find_peaks(fir_dev_ij, 
-                                            prominence=0.08, 
-                                            width=300)
-                
-                if len(peaks) > 1:
-                    # Multiple peaks found - select the one with max prominence
-                    peak_values = fir_dev_ij[peaks]
-                    max_idx = np.argmax(peak_values)
-                    locz_ij = peaks[max_idx]
-                    valz_ij = peak_values[max_idx]
-                elif len(peaks) == 1:
-                    locz_ij = peaks[0]
-                    valz_ij = fir_dev_ij[locz_ij]
-                else:
-                    locz_ij = None
-                    valz_ij = None
-
-                ### Second round of filter: set values > max peak to 0
-                if valz_ij is not None:
-                    fir_dev_ij[fir_dev_ij > valz_ij] = 0
-                
-                fir_dev_i.append(fir_dev_ij)
-
-                # Pressure at max pressure sensitivity: 1st derivative
-                if valz_ij is None or locz_ij is None:
-                    max_ps_i.append(np.nan)
-                    max_kPa_i.append(np.nan)
-                    inf_CAP_i.append(np.nan)
-                    self.max_ps_numeric[i, j] = np.nan
-                    self.max_kPa_numeric[i, j] = np.nan
-                    self.inf_CAP_numeric[i, j] = np.nan
-                else:
-                    max_ps_i.append(valz_ij)
-                    max_kPa_i.append(x_smooth[locz_ij])
-                    inf_CAP_i.append(y_smooth[locz_ij])
-                    self.max_ps_numeric[i, j] = valz_ij
-                    self.max_kPa_numeric[i, j] = x_smooth[locz_ij]
-                    self.inf_CAP_numeric[i, j] = y_smooth[locz_ij]
-                
-                # Find CAP values at 5 kPa increments (5, 10, 15, ..., 45 kPa)
-                cap_inc_ij = []
-                for p in range(1, 10):  # 1 to 9
-                    inc_mult = p * 5
-                    # Find index where x is closest to inc_mult
-                    idx = np.argmin(np.abs(x_smooth - inc_mult))
-                    if np.abs(x_smooth[idx] - inc_mult) < 2.0:
-                        cap_inc_ij.append(y_smooth[idx])
-                    else:
-                        cap_inc_ij.append(np.nan)
-                cap_inc_i.append(cap_inc_ij)
-
-                # Plot P.S curve with 1st derivative inflection
-                ax = plt.subplot(2, 4, j+1)
-                ax.set_title(f'Run# {i+1} - CH {j+1}', fontsize=12, fontweight='bold')
-                
-                # Left y-axis: CAP
-                ax.plot(x_smooth, y_smooth, '-o', markersize=2, 
-                        linewidth=1.5, color='tab:blue', label='CAP')
-                if locz_ij is not None:
-                    ax.plot(x_smooth[locz_ij], y_smooth[locz_ij], 'or', 
-                        markersize=10, linewidth=2, label='Inflection Point')
-                ax.set_xlabel('Force (kPa)', fontsize=10)
-                ax.set_ylabel('Change in CAP (pF)', fontsize=10, color='tab:blue')
-                ax.tick_params(axis='y', labelcolor='tab:blue')
-
-                # Right y-axis: 1st derivative
-                ax2 = ax.twinx()
-                ax2.plot(x_smooth[:-1], fir_dev_ij, color='tab:orange', 
-                        linewidth=1.5, label='1st Derivative')
-                if locz_ij is not None:
-                    ax2.plot(x_smooth[locz_ij], fir_dev_ij[locz_ij], 'ok', 
-                            markersize=8, linewidth=2, label='Max Slope')
-                ax2.set_ylabel('1st Derivative (pF/kPa)', fontsize=10, color='tab:orange')
-                ax2.tick_params(axis='y', labelcolor='tab:orange')
-                
-                ax.grid(True, alpha=0.3)
-
-            # Store data for this run
-            self.zaber_x.append(zaber_x_i)
-            self.zaber_y.append(zaber_y_i)
-            self.fir_dev.append(fir_dev_i)
-            self.valz.append(valz_i)
-            self.locz.append(locz_i)
-            self.max_ps.append(max_ps_i)
-            self.max_kPa.append(max_kPa_i)
-            self.inf_CAP.append(inf_CAP_i)
-            self.cap_inc.append(cap_inc_i)
-            
-            plt.tight_layout()
-
-            # Save figure
-            filename = f'PS curve all CHs number #{i+1}.png'
-            plt.savefig(filename, dpi=300, bbox_inches='tight')
-            plt.close(fig)
-
-    def _plot_all_chs_across_runs(self):
-        """Plot P.S curves of all channels across runs"""
-        fig, axes = plt.subplots(1, self.cap_size, figsize=(8*self.cap_size, 6))
-        fig.suptitle('P.S Curves of All CHs Across Runs', fontsize=16, fontweight='bold')
-
+            with self.profiler.measure('derive', run=self.run_ids[i]):
+                self._derive_run(i)
+
+    def _derive_run(self, i):
+        """Smoothed P.S curve, 1st derivative, inflection point and incremental CAP of run i"""
+        # Force window is shared by all channels: find it and smooth it once
+        # Find start and end indices based on force thresholds
+        k = np.where(self.test[i][1][:,1] - self.start_force > 0)[0][0]
+        f = np.where(self.test[i][1][:,1] - self.end_force > 0)[0][0]
+
+        x = self.test[i][1][k:f, 1]  # Force data
+        st_pt = np.where(x-0 > 0)[0][0]
+
+        # Smooth data (using moving average over SMOOTH_WINDOW, 100 samples at 200 Hz)
+        zaber_x_i = uniform_filter1d(x[st_pt:], size=self.smooth_size, mode='nearest')
+
+        # CAP of all channels as one (channels x samples) block, smoothed along time.
+        # Row j of each block is channel j, so zaber_y[i][j] / fir_dev[i][j] index as before
+        y = self.test[i][0][k:f, 1:][st_pt:].T
+        zaber_y_i = uniform_filter1d(y, size=self.smooth_size, axis=1, mode='nearest')
+
+        # 1st derivative of P.S Curve, all channels at once
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fir_dev_i = np.diff(zaber_y_i, axis=1) / np.diff(zaber_x_i)
+
+        ### First round of filter: set values > 1 or < 0 to 0
+        fir_dev_i[(fir_dev_i > 1) | (fir_dev_i < 0)] = 0
+
+        # Find peaks in first derivative (the highest qualifying peak per channel)
+        locz_i = [_max_peak(fir_dev_i[j], self.peak_width) for j in range(self.ch)]
+        valz_i = [None if loc is None else fir_dev_i[j, loc] for j, loc in enumerate(locz_i)]
+
+        ### Second round of filter: set values > max peak to 0
+        peak_val = np.array([np.inf if val is None else val for val in valz_i])
+        fir_dev_i[fir_dev_i > peak_val[:, None]] = 0
+
+        # Pressure at max pressure sensitivity: 1st derivative
+        found = np.array([loc is not None for loc in locz_i])
+        loc = np.array([0 if l is None else l for l in locz_i])
+        rows = np.arange(self.ch)
+        self.max_ps_numeric[i] = np.where(found, peak_val, np.nan)
+        self.max_kPa_numeric[i] = np.where(found, zaber_x_i[loc], np.nan)
+        self.inf_CAP_numeric[i] = np.where(found, zaber_y_i[rows, loc], np.nan)
+        max_ps_i = list(self.max_ps_numeric[i])
+        max_kPa_i = list(self.max_kPa_numeric[i])
+        inf_CAP_i = list(self.inf_CAP_numeric[i])
+
+        # Find CAP values at each pressure increment (5, 10, 15, ..., 45 kPa by default).
+        # The force samples are shared, so the lookup is done once for all channels
+        inc_idx = increment_lookup(zaber_x_i, self.pressure_grid)
+        cap_inc_i = np.where(inc_idx >= 0, zaber_y_i[:, inc_idx], np.nan) # channels x increments
+
+        # Store data for this run
+        self.zaber_x.append(zaber_x_i)
+        self.zaber_y.append(self._keep(f'run{i}_zaber_y', zaber_y_i))
+        self.fir_dev.append(self._keep(f'run{i}_fir_dev', fir_dev_i))
+        self.valz.append(valz_i)
+        self.locz.append(locz_i)
+        self.max_ps.append(max_ps_i)
+        self.max_kPa.append(max_kPa_i)
+        self.inf_CAP.append(inf_CAP_i)
+        self.cap_inc.append(cap_inc_i)
+
+    def _ps_curve_figures(self):
+        """Figure jobs for the P.S curve with 1st derivative inflection, all channels per run"""
+        self._derive()
+        return [(figures.ps_curve_run, dict(
+                    filename=f'PS curve all CHs number #{i+1}',
+                    run=i+1, x_smooth=self.zaber_x[i], y_smooth=self.zaber_y[i],
+                    fir_dev=self.fir_dev[i], locz=self.locz[i]))
+                for i in range(self.cap_size)]
+
+    def _all_chs_across_runs_figure(self):
+        """Figure job for the P.S curves of all channels across runs"""
+        self._synch()
+        curves = []
         for i in range(self.cap_size):
             print(f"Processing run {i+1}/{self.cap_size}...")
+            # Find start point
+            k = np.where(self.test[i][1][:, 1] - self.start_force > 0)[0][0]
             
-            for j in range(self.ch):
-                # Find start point
-                k = np.where(self.test[i][1][:, 1] - self.start_force > 0)[0][0]
-                
-                # Find end point based on max force from first run
-                max_force_threshold = np.floor(np.max(self.test[0][1][:, 1]) - 1)
-                f = np.where(self.test[i][1][:, 1] - max_force_threshold > 0)[0][0]
-                
-                x = self.test[i][1][k:f, 1]  # Force data
-                y = self.test[i][0][k:f, j+1]  # CAP data for channel j
-                
-                # Smooth data
-                st_pt = np.where(x - 0 > 0)[0][0]
-                
-                x_smooth = uniform_filter1d(x[st_pt:], size=100, mode='nearest')
-                y_smooth = uniform_filter1d(y[st_pt:], size=100, mode='nearest')
-                
-                # Plot P.S curve
-                axes[i].plot(x_smooth, y_smooth, '-', linewidth=2, label=f'Ch. #: {j+1}')
-                axes[i].set_title(f'Run {i+1}', fontsize=14, fontweight='bold')
-                axes[i].set_xlabel('Force (kPa)', fontsize=12)
-                axes[i].set_ylabel('Change in CAP (pF)', fontsize=12)
-                axes[i].grid(True, alpha=0.3)
-                axes[i].legend(loc='lower right', fontsize=10)
-
-        plt.tight_layout()
-        filename = 'PS curves all ch per run.png'
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close(fig)
-
-    def _plot_all_runs_across_chs(self):
-        """Plot P.S curves of all runs across channels"""
-        fig, axes = plt.subplots(2, 4, figsize=(20, 10))
-        fig.suptitle('P.S Curves of All Runs Across Channels', fontsize=18, fontweight='bold')
-
-        # Flatten axes for easier indexing
-        axes = axes.flatten()
-
-        # Define colors for each run
-        num_runs = len(self.test)
-        colors = plt.cm.tab10(np.linspace(0, 1, num_runs))
-        for i in range(num_runs):
-            for j in range(self.ch):
-                # Plot P.S curve for run i, channel j
-                axes[j].plot(self.zaber_x[i], self.zaber_y[i][j], '-', 
-                            linewidth=2.5, 
-                            color=colors[i],
-                            label=f'Run {i+1}',
-                            alpha=0.8)
-                
-                axes[j].set_title(f'CH {j+1}', fontsize=14, fontweight='bold')
-                axes[j].set_xlabel('Force (kPa)', fontsize=11)
-                axes[j].set_ylabel('Change in CAP (pF)', fontsize=11)
-                axes[j].grid(True, alpha=0.3)
-
-        # Add legend to each subplot (only once after all runs are plotted)
-        for j in range(self.ch):
-            axes[j].legend(loc='lower right', fontsize=10, framealpha=0.9)
-
-        # Hide extra subplots if ch < 8
-        for j in range(self.ch, 8):
-            axes[j].axis('off')
-
-        plt.tight_layout()
-        # Save figure
-        filename = 'PS curves all run per CH.png'
-        plt.savefig(filename, dpi=300, bbox_inches='tight')
-        plt.close(fig)
+            # Find end point based on max force from first run
+            max_force_threshold = np.floor(np.max(self.test[0][1][:, 1]) - 1)
+            f = np.where(self.test[i][1][:, 1] - max_force_threshold > 0)[0][0]
+            
+            x = self.test[i][1][k:f, 1]  # Force data
+            y = self.test[i][0][k:f, 1:]  # CAP data for all channels
+            
+            # Smooth data, all channels at once
+            st_pt = np.where(x - 0 > 0)[0][0]
+            
+            x_smooth = uniform_filter1d(x[st_pt:], size=self.smooth_size, mode='nearest')
+            y_smooth = uniform_filter1d(y[st_pt:].T, size=self.smooth_size, axis=1, mode='nearest')
+            curves_i = [(x_smooth, y_smooth[j]) for j in range(self.ch)]
+            curves.append(curves_i)
+
+        return (figures.ps_curves_per_run, dict(
+            filename='PS curves all ch per run', curves=curves))
+
+    def _all_runs_across_chs_figure(self):
+        """Figure job for the P.S curves of all runs across channels"""
+        self._derive()
+        return (figures.ps_curves_per_channel, dict(
+            filename='PS curves all run per CH',
+            zaber_x=self.zaber_x, zaber_y=self.zaber_y))
+
+    def save_figures(self, dpi=300, fmt='png', decimate=True, out_dir=None, force=False):
+        """
+        Render and save every analysis figure, computing only the stages they need.
+        Figures are rendered across the worker pool; does nothing when headless.
+        A figure is only re-rendered when its data or parameters changed since it
+        was last saved (see figures.render).
+
+        Parameters:
+            dpi: Resolution of raster formats
+            fmt: Any format matplotlib can save ('png', 'jpg', 'svg', 'pdf', ...)
+            decimate: Reduce long traces to about one point per pixel (markers stay exact)
+            out_dir: Folder for the figures, default <path>/figures
+            force: Re-render every figure, even unchanged ones
+        """
+        if self.headless:
+            print("Headless analysis, no figures rendered")
+            return
+
+        with self.profiler.measure('figures'):
+            jobs = (self._raw_signal_figures() +
+                    self._ps_curve_figures() +
+                    [self._all_chs_across_runs_figure(),
+                     self._all_runs_across_chs_figure()])
+            out_dir = Path(out_dir) if out_dir is not None else self.path / FIGURES_DIR
+            figures.render(jobs, workers=self.workers, dpi=dpi, fmt=fmt, decimate=decimate,
+                           out_dir=out_dir, force=force)
+        if self.progress is not None:
+            self.progress('figures')
 
     def save_data(self):
         """
         Calculate and return analysis results as a dictionary.
         Calculates Mean, STD, and COV of P.S and Force at Inflection; Max CAP; Incremental CAP values
+        No figures are rendered; the result is computed once and reused on later calls.
+        With profiling on, the result also holds the profile_report() under 'profile'.
+        """
+        self._stats()
+        result = dict(self.result)
+        if self.profiler.enabled:
+            result['profile'] = self.profile_report()
+        return result
+
+    def profile_report(self):
+        """
+        Per-stage and per-run wall time, CPU time (and allocations in 'memory'
+        mode) measured so far, as a JSON-serializable dict; see StageProfiler.report
         """
+        return self.profiler.report()
+
+    @stage
+    def _stats(self):
+        """Cross-run and cross-channel statistics behind save_data()"""
+        if self.incremental:
+            self.result = self._incremental_stats()
+            return
+        self._derive()
         result = {}
         
+        # Per-run, per-channel results and their mean, std, and cov across runs
+        nan_policy = self.nan_policy
         # P.S Curve Inflection Point pressure sensitivity and force: mean, std, and cov
         result['max_ps'] = self.max_ps_numeric
-        result['mean_max_ps'] = np.mean(result['max_ps'], axis=0)
-        result['std_max_ps'] = np.std(result['max_ps'], axis=0, ddof=1) 
-        result['cov_max_ps'] = result['std_max_ps'] / result['mean_max_ps']
+        result['mean_max_ps'], result['std_max_ps'], result['cov_max_ps'] = \
+            mean_std_cov(result['max_ps'], nan_policy=nan_policy)
         
         result['max_kpa'] = self.max_kPa_numeric 
-        result['mean_max_kpa'] = np.mean(result['max_kpa'], axis=0) 
-        result['std_max_kpa'] = np.std(result['max_kpa'], ddof=1, axis=0)
-        result['cov_max_kpa'] = result['std_max_kpa'] / result['mean_max_kpa']
+        result['mean_max_kpa'], result['std_max_kpa'], result['cov_max_kpa'] = \
+            mean_std_cov(result['max_kpa'], nan_policy=nan_policy)
 
         # P.S Curve Max CAP
         result['max_cap'] = self.c
-        result['mean_max_cap'] = np.mean(result['max_cap'], axis=0)
-        result['std_max_cap'] = np.std(result['max_cap'], ddof=1, axis=0)
-        result['max_cap_cov'] = result['std_max_cap'] / result['mean_max_cap']
+        result['mean_max_cap'], result['std_max_cap'], result['max_cap_cov'] = \
+            mean_std_cov(result['max_cap'], nan_policy=nan_policy)
 
         # P.S Curve CAP at Inflection Point
         result['inf_cap'] = self.inf_CAP_numeric
-        result['mean_inf_cap'] = np.mean(result['inf_cap'], axis=0)
-        result['std_inf_cap'] = np.std(result['inf_cap'], ddof=1, axis=0)
-        result['cov_inf_cap'] = result['std_inf_cap'] / result['mean_inf_cap']
+        result['mean_inf_cap'], result['std_inf_cap'], result['cov_inf_cap'] = \
+            mean_std_cov(result['inf_cap'], nan_policy=nan_policy)
 
         # CH Variability Calculation:
-        # CHs variability across 9 incremental points along the P.S curve (increments of 5kPa)
-        n_channels = len(self.cap_inc)           # Number of runs (first dimension)
-        n_runs = len(self.cap_inc[0])    # Number of channels (second dimension) 
-        inc_arr = []
-        ch_var_center4_mean = np.zeros((n_channels, 9))
-        ch_var_center4_std = np.zeros((n_channels, 9))
-        ch_var_outer4_mean = np.zeros((n_channels, 9))
-        ch_var_outer4_std = np.zeros((n_channels, 9))
-        ch_var_allch_mean = np.zeros((n_channels, 9))
-        ch_var_allch_std = np.zeros((n_channels, 9))
-        
-        for a in range(n_channels):
-            # Collect all runs for this channel
-            run_data = []
-            for b in range(n_runs):
-                run_data.append(self.cap_inc[a][b])
-            
-            # Stack into array (9 increments × n_runs)
-            inc_arr.append(np.column_stack(run_data))
-            
-            for inc in range(9):
-                # Center 4 CHs: 
-                ch_var_center4_mean[a, inc] = np.mean(inc_arr[a][inc, 2:6], axis=0)
-                ch_var_center4_std[a, inc] = np.std(inc_arr[a][inc, 2:6], ddof=1, axis=0)
-
-                # Outer 4 CHs: 
-                ch_var_outer4_mean[a, inc] = np.mean(inc_arr[a][inc, [0, 1, 6, 7]], axis=0)
-                ch_var_outer4_std[a, inc] = np.std(inc_arr[a][inc, [0, 1, 6, 7]], ddof=1, axis=0)
-
-                # All CHs
-                ch_var_allch_mean[a, inc] = np.mean(inc_arr[a][inc, :], axis=0)
-                ch_var_allch_std[a, inc] = np.std(inc_arr[a][inc, :], ddof=1, axis=0)
-
-        # save data for CH variability calculation for center 4 CHs
-        result['inc_arr'] = inc_arr
-        result['ch_var_center4_mean'] = ch_var_center4_mean
-        result['ch_var_center4_std'] = ch_var_center4_std
-        result['ch_var_center4_cov'] = result['ch_var_center4_std'] / result['ch_var_center4_mean']
-        result['avg_ch_var_center4_mean'] = np.mean(result['ch_var_center4_mean'], axis=0)
-        result['avg_ch_var_center4_cov'] = np.mean(result['ch_var_center4_cov'], axis=0)
-
-        # save data for CH variability calculation for outer 4 CHs
-        result['ch_var_outer4_mean'] = ch_var_outer4_mean
-        result['ch_var_outer4_std'] = ch_var_outer4_std
-        result['ch_var_outer4_cov'] = result['ch_var_outer4_std'] / result['ch_var_outer4_mean']
-        result['avg_ch_var_outer4_mean'] = np.mean(result['ch_var_outer4_mean'], axis=0)
-        result['avg_ch_var_outer4_cov'] = np.mean(result['ch_var_outer4_cov'], axis=0)
-
-        # Save data for CH variability calculation for all CHs
-        result['ch_var_allch_mean'] = ch_var_allch_mean
-        result['ch_var_allch_std'] = ch_var_allch_std
-        result['ch_var_allch_cov'] = result['ch_var_allch_std'] / result['ch_var_allch_mean']
-        result['avg_ch_var_allch_mean'] = np.mean(result['ch_var_allch_mean'], axis=0)  # Average across runs
-        result['avg_ch_var_allch_cov'] = np.mean(result['ch_var_allch_cov'], axis=0)    # Average across runs
+        # CHs variability across the incremental points along the P.S curve (pressure_grid),
+        # for every channel group at once from one (runs x channels x increments) array
+        cap_inc = np.stack(self.cap_inc)
+        result['inc_arr'] = list(cap_inc.transpose(0, 2, 1)) # per run: increments x channels
+        result.update(channel_variability(cap_inc, self.channel_groups, nan_policy))
 
         result['shorted_ch'] = self.shorted_ch
 
@@ -578,6 +767,92 @@ class Analysis():
         result['zaber_x'] = self.zaber_x
         result['zaber_y'] = self.zaber_y
 
-        return result
+        self.result = result
 
+    def _incremental_stats(self):
+        """
+        save_data() result from per-run results stored in the session cache.
+        Only runs without a stored result are processed; the cross-run mean,
+        std and COV are running (Welford) statistics updated with the new runs.
+        """
+        store = RunStore(self.run_cache.cache_path, params_key(
+            sensor_type=self.sensor_type, sync_mode=self.sync_mode,
+            sync_channel=self.sync_channel, pressure_grid=self.pressure_grid,
+            start_force=self.start_force, end_force=self.end_force, SA=self.SA,
+            cap_dtype=self.cap_dtype, rate=self.rate))
+        keys = [store.run_key(cap_file, fut_file)
+                for cap_file, fut_file in zip(self.csv_files, self.fut_files)]
+
+        runs = [store.load_run(key) for key in keys] # None: not stored yet or unreadable
+        new = [i for i, run in enumerate(runs) if run is None]
+        if new:
+            # Run the regular stages on just the new or changed runs
+            print(f"Processing {len(new)} new run(s) of {len(keys)}")
+            sub = Analysis(self.path, self.sensor_id, self.sensor_type,
+                           use_cache=self.run_cache.enabled, workers=self.workers,
+                           headless=True, sync_mode=self.sync_mode,
+                           sync_channel=self.sync_channel, pressure_grid=self.pressure_grid,
+                           runs=[self.run_ids[i] for i in new],
+                           cap_dtype=self.cap_dtype, chunksize=self.chunksize,
+                           out_of_core=self.out_of_core, rate=self.rate)
+            sub.profiler = self.profiler # its stages are measured as part of this one
+            sub._derive()
+            for r, i in enumerate(new):
+                runs[i] = {name: np.asarray(values) for name, values in dict(
+                    test_cap=sub.test[r][0], test_fut=sub.test[r][1],
+                    zaber_x=sub.zaber_x[r], zaber_y=sub.zaber_y[r],
+                    max_ps=sub.max_ps_numeric[r], max_kpa=sub.max_kPa_numeric[r],
+                    max_cap=sub.c[r], inf_cap=sub.inf_CAP_numeric[r],
+                    cap_inc=sub.cap_inc[r], shorted_ch=sub.shorted_chs[r]).items()}
+                store.save_run(keys[i], **runs[i])
+        if not self.subset:
+            # Stored runs of the other runs stay valid when only a subset is analyzed
+            store.prune(keys)
 
+        result = {}
+        for name in ('max_ps', 'max_kpa', 'max_cap', 'inf_cap'):
+            result[name] = np.array([run[name] for run in runs])
+        cap_inc = np.array([run['cap_inc'] for run in runs])
+        result['inc_arr'] = list(cap_inc.transpose(0, 2, 1)) # per run: increments x channels
+        ch_var = channel_variability(cap_inc, self.channel_groups, self.nan_policy)
+        result.update(ch_var)
+
+        # Per-run values folded into the running statistics
+        per_run = {name: result[name] for name in ('max_ps', 'max_kpa', 'max_cap', 'inf_cap')}
+        for group in self.channel_groups:
+            for stat in ('mean', 'cov'):
+                per_run[f'ch_var_{group}_{stat}'] = ch_var[f'ch_var_{group}_{stat}']
+        shapes = {name: values.shape[1:] for name, values in per_run.items()}
+
+        omit_nan = self.nan_policy == 'omit'
+        # Stored runs do not depend on the channel groups, the statistics do
+        groups_key = params_key(channel_groups={name: [int(c) for c in chs]
+                                                for name, chs in self.channel_groups.items()})
+        stats, done = store.load_stats(list(per_run), shapes, omit_nan, keys, groups_key)
+        for i in range(done, len(keys)):
+            for name, values in per_run.items():
+                stats[name].add(values[i])
+        if not self.subset:
+            # Saved statistics always cover the whole session
+            store.save_stats(stats, omit_nan, keys, groups_key)
+
+        # P.S Curve inflection pressure sensitivity and force, max CAP, CAP at inflection
+        for name, mean_key, std_key, cov_key in (
+                ('max_ps', 'mean_max_ps', 'std_max_ps', 'cov_max_ps'),
+                ('max_kpa', 'mean_max_kpa', 'std_max_kpa', 'cov_max_kpa'),
+                ('max_cap', 'mean_max_cap', 'std_max_cap', 'max_cap_cov'),
+                ('inf_cap', 'mean_inf_cap', 'std_inf_cap', 'cov_inf_cap')):
+            result[mean_key] = stats[name].mean
+            result[std_key] = stats[name].std()
+            result[cov_key] = stats[name].cov()
+
+        # CH variability averaged across runs
+        for group in self.channel_groups:
+            result[f'avg_ch_var_{group}_mean'] = stats[f'ch_var_{group}_mean'].mean
+            result[f'avg_ch_var_{group}_cov'] = stats[f'ch_var_{group}_cov'].mean
+
+        result['shorted_ch'] = runs[-1]['shorted_ch'] if runs else None
+        result['test'] = [[run['test_cap'], run['test_fut']] for run in runs]
+        result['zaber_x'] = [run['zaber_x'] for run in runs]
+        result['zaber_y'] = [run['zaber_y'] for run in runs]
+        return result
@@ -0,0 +1,68 @@
+import warnings
+import numpy as np
+
+# Default channel groups for CH variability, indices into the (reordered) channels
+CHANNEL_GROUPS = {
+    'center4': [2, 3, 4, 5],
+    'outer4': [0, 1, 6, 7],
+    'allch': list(range(8)),
+}
+
+def mean_std_cov(arr, axis=0, nan_policy='propagate'):
+    """
+    Mean, sample standard deviation (ddof=1) and COV of arr along axis
+
+    Parameters:
+        arr: Array of results, e.g. (runs x channels)
+        axis: Axis to reduce
+        nan_policy: 'propagate' (any NaN gives NaN) or 'omit' (ignore NaNs)
+    """
+    # All-NaN slices give NaN; nanmean/nanstd warn about them through warnings, not errstate
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if nan_policy == 'omit':
+            mean = np.nanmean(arr, axis=axis)
+            std = np.nanstd(arr, axis=axis, ddof=1)
+        elif nan_policy == 'propagate':
+            mean = np.mean(arr, axis=axis)
+            std = np.std(arr, axis=axis, ddof=1)
+        else:
+            raise ValueError(f"Invalid nan_policy: {nan_policy}")
+        return mean, std, std / mean
+
+def channel_variability(cap_inc, groups=None, nan_policy='propagate'):
+    """
+    Variability across channels of the CAP values at each pressure increment
+
+    Every group is reduced over its channel axis in one call, so the cost does
+    not depend on the number of runs or increments.
+
+    Parameters:
+        cap_inc: (runs x channels x increments) array of CAP values
+        groups: {name: channel indices}, defaults to CHANNEL_GROUPS
+        nan_policy: see mean_std_cov
+
+    Returns:
+        dict with ch_var_<name>_mean/_std/_cov (runs x increments) and
+        avg_ch_var_<name>_mean/_cov (increments, averaged across runs)
+    """
+    if groups is None:
+        groups = CHANNEL_GROUPS
+
+    result = {}
+    for name, chs in groups.items():
+        mean, std, cov = mean_std_cov(cap_inc[:, chs, :], axis=1, nan_policy=nan_policy)
+        result[f'ch_var_{name}_mean'] = mean
+        result[f'ch_var_{name}_std'] = std
+        result[f'ch_var_{name}_cov'] = cov
+
+        # Average across runs
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            if nan_policy == 'omit':
+                result[f'avg_ch_var_{name}_mean'] = np.nanmean(mean, axis=0)
+                result[f'avg_ch_var_{name}_cov'] = np.nanmean(cov, axis=0)
+            else:
+                result[f'avg_ch_var_{name}_mean'] = np.mean(mean, axis=0)
+                result[f'avg_ch_var_{name}_cov'] = np.mean(cov, axis=0)
+    return result
@@ -0,0 +1,294 @@
+"""
+Figure renderers for eb_analysis
+
+Every renderer builds its own Figure on an Agg canvas instead of going
+through pyplot, so no global figure state is shared and renderers can run
+side by side in worker processes. Each one takes plain numpy arrays and
+the output filename (without extension) and writes a single file.
+
+Long traces are decimated to about one point per output pixel before they
+are plotted (min/max per bucket, so peaks and edges survive); markers such
+as inflection points are always drawn from the full data.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+def _new_figure(figsize):
+    """Create a Figure attached to a non-interactive Agg canvas"""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+MANIFEST_NAME = "figures_manifest.json"
+FIGURES_VERSION = 1 # bump when a renderer's output changes for the same inputs
+
+def decimation_index(n, n_buckets, series, keep=()):
+    """
+    Indices of a visually faithful subset of n samples for plotting.
+
+    The samples are split into n_buckets equal buckets and the first and last
+    sample plus the minimum and maximum of every series in each bucket are
+    kept, so the plotted envelope matches the full trace. Indices in keep
+    are always included. Returns all indices when there is nothing to gain.
+
+    Parameters:
+        n: Number of samples
+        n_buckets: Buckets, e.g. half the axes width in pixels
+        series: Arrays of length n whose extremes must be kept (e.g. x and y of a curve)
+        keep: Extra indices to keep, e.g. a marked inflection point
+    """
+    if n <= 4 * n_buckets:
+        return np.arange(n)
+    size = int(np.ceil(n / n_buckets))
+    n_buckets = int(np.ceil(n / size))
+    starts = np.arange(n_buckets) * size
+    pad = n_buckets * size - n
+
+    idx = [np.array([0, n - 1]), np.asarray([k for k in keep if k is not None], dtype=int)]
+    for values in series:
+        block = np.pad(np.asarray(values, dtype=float), (0, pad), mode='edge').reshape(n_buckets, size)
+        idx.append(starts + np.argmin(block, axis=1))
+        idx.append(starts + np.argmax(block, axis=1))
+    idx = np.unique(np.concatenate(idx))
+    return idx[idx < n]
+
+def _buckets(fig_width, n_cols, dpi, decimate):
+    """Buckets for decimating a trace in one of n_cols panels of a fig_width inch figure"""
+    return int(fig_width * dpi / n_cols) // 2 if decimate else np.inf
+
+def _save(fig, filename, dpi, fmt):
+    """Lay out and save fig as <filename>.<fmt>"""
+    fig.tight_layout()
+    fig.savefig(f"{filename}.{fmt}", dpi=dpi, format=fmt, bbox_inches='tight')
+
+def raw_signal(filename, run, ch, time_c, cap, time_f, force, dpi=300, fmt='png', decimate=True):
+    """Raw Signal of one channel of one run: CAP vs time, force vs time, CAP vs force"""
+    fig = _new_figure(figsize=(10, 12))
+    ax1, ax2, ax3 = fig.subplots(3, 1)
+    n_buckets = _buckets(10, 1, dpi, decimate)
+
+    # Subplot 1: CAP vs Time
+    idx = decimation_index(len(cap), n_buckets, [cap])
+    ax1.plot(time_c[idx], cap[idx])
+    ax1.set_ylabel('Change in CAP (pF)', fontsize=12)
+    ax1.set_xlabel('Time (s)', fontsize=12)
+    ax1.set_title(f'Raw Signal - Run #{run} - CH{ch}', fontsize=14, fontweight='bold')
+    ax1.grid(True, alpha=0.3)
+
+    # Subplot 2: Force vs Time
+    idx = decimation_index(len(force), n_buckets, [force])
+    ax2.plot(time_f[idx], force[idx])
+    ax2.set_ylabel('Force (kPa)', fontsize=12)
+    ax2.set_xlabel('Time (s)', fontsize=12)
+    ax2.grid(True, alpha=0.3)
+
+    # Subplot 3: CAP vs Force (Hysteresis)
+    idx = decimation_index(len(force), n_buckets, [force, cap])
+    ax3.plot(force[idx], cap[idx])
+    ax3.set_xlabel('Force (kPa)', fontsize=12)
+    ax3.set_ylabel('Change in CAP (pF)', fontsize=12)
+    ax3.grid(True, alpha=0.3)
+
+    # Link x-axes of first two subplots
+    ax1.sharex(ax2)
+    _save(fig, filename, dpi, fmt)
+
+def ps_curve_run(filename, run, x_smooth, y_smooth, fir_dev, locz, dpi=300, fmt='png', decimate=True):
+    """P.S curve with 1st derivative inflection for every channel of one run (2x4 grid)"""
+    fig = _new_figure(figsize=(20, 10))
+    n_buckets = _buckets(20, 4, dpi, decimate)
+
+    for j in range(len(y_smooth)):
+        y = y_smooth[j]
+        loc = locz[j]
+
+        ax = fig.add_subplot(2, 4, j+1)
+        ax.set_title(f'Run# {run} - CH {j+1}', fontsize=12, fontweight='bold')
+
+        # Left y-axis: CAP (the line is decimated, the inflection marker uses the full data)
+        idx = decimation_index(len(y), n_buckets, [x_smooth, y], keep=[loc])
+        ax.plot(x_smooth[idx], y[idx], '-o', markersize=2,
+                linewidth=1.5, color='tab:blue', label='CAP')
+        if loc is not None:
+            ax.plot(x_smooth[loc], y[loc], 'or',
+                    markersize=10, linewidth=2, label='Inflection Point')
+        ax.set_xlabel('Force (kPa)', fontsize=10)
+        ax.set_ylabel('Change in CAP (pF)', fontsize=10, color='tab:blue')
+        ax.tick_params(axis='y', labelcolor='tab:blue')
+
+        # Right y-axis: 1st derivative
+        ax2 = ax.twinx()
+        idx = decimation_index(len(fir_dev[j]), n_buckets, [fir_dev[j]], keep=[loc])
+        ax2.plot(x_smooth[idx], fir_dev[j][idx], color='tab:orange',
+                 linewidth=1.5, label='1st Derivative')
+        if loc is not None:
+            ax2.plot(x_smooth[loc], fir_dev[j][loc], 'ok',
+                     markersize=8, linewidth=2, label='Max Slope')
+        ax2.set_ylabel('1st Derivative (pF/kPa)', fontsize=10, color='tab:orange')
+        ax2.tick_params(axis='y', labelcolor='tab:orange')
+
+        ax.grid(True, alpha=0.3)
+
+    _save(fig, filename, dpi, fmt)
+
+def ps_curves_per_run(filename, curves, dpi=300, fmt='png', decimate=True):
+    """
+    P.S curves of all channels across runs, one panel per run
+
+    curves: curves[i][j] is the (force, CAP) pair of run i, channel j
+    """
+    n_runs = len(curves)
+    fig = _new_figure(figsize=(8*n_runs, 6))
+    n_buckets = _buckets(8, 1, dpi, decimate)
+    axes = fig.subplots(1, n_runs, squeeze=False)[0]
+    fig.suptitle('P.S Curves of All CHs Across Runs', fontsize=16, fontweight='bold')
+
+    for i in range(n_runs):
+        for j, (x, y) in enumerate(curves[i]):
+            idx = decimation_index(len(y), n_buckets, [x, y])
+            axes[i].plot(x[idx], y[idx], '-', linewidth=2, label=f'Ch. #: {j+1}')
+        axes[i].set_title(f'Run {i+1}', fontsize=14, fontweight='bold')
+        axes[i].set_xlabel('Force (kPa)', fontsize=12)
+        axes[i].set_ylabel('Change in CAP (pF)', fontsize=12)
+        axes[i].grid(True, alpha=0.3)
+        axes[i].legend(loc='lower right', fontsize=10)
+
+    _save(fig, filename, dpi, fmt)
+
+def ps_curves_per_channel(filename, zaber_x, zaber_y, dpi=300, fmt='png', decimate=True):
+    """P.S curves of all runs across channels, one panel per channel (2x4 grid)"""
+    fig = _new_figure(figsize=(20, 10))
+    n_buckets = _buckets(20, 4, dpi, decimate)
+    axes = fig.subplots(2, 4).flatten()
+    fig.suptitle('P.S Curves of All Runs Across Channels', fontsize=18, fontweight='bold')
+
+    # Define colors for each run
+    num_runs = len(zaber_x)
+    n_ch = len(zaber_y[0]) if num_runs else 0
+    colors = colormaps['tab10'](np.linspace(0, 1, num_runs))
+    for i in range(num_runs):
+        for j in range(n_ch):
+            idx = decimation_index(len(zaber_x[i]), n_buckets, [zaber_x[i], zaber_y[i][j]])
+            axes[j].plot(zaber_x[i][idx], zaber_y[i][j][idx], '-',
+                         linewidth=2.5,
+                         color=colors[i],
+                         label=f'Run {i+1}',
+                         alpha=0.8)
+
+    for j in range(n_ch):
+        axes[j].set_title(f'CH {j+1}', fontsize=14, fontweight='bold')
+        axes[j].set_xlabel('Force (kPa)', fontsize=11)
+        axes[j].set_ylabel('Change in CAP (pF)', fontsize=11)
+        axes[j].grid(True, alpha=0.3)
+        axes[j].legend(loc='lower right', fontsize=10, framealpha=0.9)
+
+    # Hide extra subplots if ch < 8
+    for j in range(n_ch, 8):
+        axes[j].axis('off')
+
+    _save(fig, filename, dpi, fmt)
+
+def _update_hash(h, value):
+    """Feed a renderer argument (arrays, nested lists/tuples, scalars, None) into hash h"""
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update(f"a{value.dtype.str}{value.shape}".encode())
+        h.update(value.data)
+    elif isinstance(value, (list, tuple)):
+        h.update(f"l{len(value)}".encode())
+        for item in value:
+            _update_hash(h, item)
+    else:
+        h.update(f"v{value!r}".encode())
+
+def job_hash(renderer, kwargs, **params):
+    """
+    Hash of everything a figure depends on: the renderer, its data and the
+    render parameters (dpi, fmt, ...); the filename is not part of it
+    """
+    h = hashlib.sha1(f"{FIGURES_VERSION}|{renderer.__name__}".encode())
+    for name in sorted(params):
+        _update_hash(h, (name, params[name]))
+    for name in sorted(kwargs):
+        if name != 'filename':
+            h.update(name.encode())
+            _update_hash(h, kwargs[name])
+    return h.hexdigest()
+
+def _load_manifest(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh).get('figures', {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable figure manifest {path}: {e}")
+        return {}
+
+def render(jobs, workers=1, dpi=300, fmt='png', decimate=True, out_dir=None, force=False):
+    """
+    Render a list of (renderer, kwargs) jobs into out_dir
+
+    Each job's filename is taken relative to out_dir (default: working
+    directory). A manifest in out_dir keeps the hash of the data and
+    parameters every figure was rendered from; jobs whose figure file
+    exists with the same hash are skipped unless force is set.
+
+    Jobs run in a process pool when workers > 1, otherwise one after the
+    other in this process. Any renderer error is raised once all jobs finish.
+    decimate=False plots every sample of every trace.
+
+    Returns:
+        Number of figures rendered
+    """
+    out_dir = Path(out_dir) if out_dir is not None else Path.cwd()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST_NAME
+    manifest = _load_manifest(manifest_path)
+
+    todo = []
+    for renderer, kwargs in jobs:
+        filename = out_dir / kwargs['filename']
+        name = f"{filename.name}.{fmt}"
+        digest = job_hash(renderer, kwargs, dpi=dpi, fmt=fmt, decimate=decimate)
+        if not force and manifest.get(name) == digest and filename.with_name(name).exists():
+            continue
+        todo.append((name, digest, renderer, dict(kwargs, filename=filename)))
+    print(f"Rendering {len(todo)} of {len(jobs)} figures")
+
+    errors = []
+    n_workers = min(workers, len(todo))
+    if n_workers <= 1:
+        for name, digest, renderer, kwargs in todo:
+            try:
+                renderer(dpi=dpi, fmt=fmt, decimate=decimate, **kwargs)
+                manifest[name] = digest
+            except Exception as e:
+                manifest.pop(name, None)
+                errors.append(e)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [pool.submit(renderer, dpi=dpi, fmt=fmt, decimate=decimate, **kwargs)
+                       for name, digest, renderer, kwargs in todo]
+        for (name, digest, _, _), future in zip(todo, futures):
+            try:
+                future.result()
+                manifest[name] = digest
+            except Exception as e:
+                manifest.pop(name, None)
+                errors.append(e)
+
+    # Only figures that were actually written are recorded
+    tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+    tmp.write_text(json.dumps({'version': FIGURES_VERSION, 'figures': manifest}, indent=1))
+    os.replace(tmp, manifest_path)
+    if errors:
+        raise errors[0]
+    return len(todo)
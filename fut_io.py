@@ -0,0 +1,104 @@
+"""
+FUT load cell run files
+
+A run is written as "Run N.csv" (Index, Load Cell, Time) in one bulk call.
+The Excel copy "Run N.xlsx" that older sessions only have is optional and
+written a column at a time. Readers prefer the csv when both exist.
+
+Time is each reading's own timestamp (s). When the wall clock at time 0 is
+known it is written to "Run N.json" with the run's timing statistics.
+"""
+import json
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+FUT_COLUMNS = ['Index', 'Load Cell', 'Time']
+POSITION_COLUMN = 'Position' # optional stage position (mm) after FUT_COLUMNS
+FUT_SUFFIXES = ['.csv', '.xlsx'] # in order of preference
+
+def write_run(folder, run, force, time, xlsx=False, start=None, position=None):
+    """
+    Save one run's load cell readings
+
+    Parameters:
+        folder: Folder the run file goes in
+        run: Run number, the file is "Run <run>.csv"
+        force: Load cell readings (N)
+        time: Time of each reading (s)
+        xlsx: Also write "Run <run>.xlsx" for Excel users
+        start: Wall clock (datetime) at time 0, written to "Run <run>.json"
+        position: Stage position (mm) at each reading, adds a Position column
+
+    Returns:
+        Path of the csv run file
+    """
+    force = np.asarray(force, dtype=float)
+    time = np.asarray(time, dtype=float)
+    index = np.arange(1, len(force) + 1)
+
+    path = Path(folder) / f"Run {run}.csv"
+    data = pd.DataFrame({FUT_COLUMNS[0]: index, FUT_COLUMNS[1]: force, FUT_COLUMNS[2]: time})
+    if position is not None:
+        position = np.asarray(position, dtype=float)
+        data[POSITION_COLUMN] = position
+    data.to_csv(path, index=False)
+
+    if xlsx:
+        write_run_xlsx(path.with_suffix('.xlsx'), run, index, force, time, position)
+    if start is not None:
+        info = dict(start=start.isoformat(), samples=len(time), **timing_stats(time))
+        path.with_suffix('.json').write_text(json.dumps(info, indent=1))
+    return path
+
+def timing_stats(time):
+    """
+    Sampling of a time column: mean rate (Hz), jitter (std of the sample
+    interval, ms) and the longest gap between readings (ms)
+    """
+    time = np.asarray(time, dtype=float)
+    if len(time) < 2:
+        return {'rate_hz': None, 'jitter_ms': None, 'max_gap_ms': None}
+    dt = np.diff(time)
+    return {'rate_hz': float((len(time) - 1) / (time[-1] - time[0])) if time[-1] > time[0] else None,
+            'jitter_ms': float(np.std(dt) * 1000),
+            'max_gap_ms': float(np.max(dt) * 1000)}
+
+def write_run_xlsx(path, run, index, force, time, position=None):
+    """Excel copy of a run file, each column written in a single call"""
+    workbook = xlsxwriter.Workbook(path)
+    worksheet = workbook.add_worksheet(str(run))
+    columns = (index, force, time) if position is None else (index, force, time, position)
+    worksheet.write_row(0, 0, FUT_COLUMNS + [POSITION_COLUMN][:len(columns) - 3])
+    for col, values in enumerate(columns):
+        worksheet.write_column(1, col, values.tolist())
+    workbook.close()
+
+def read_run(f):
+    """Parse a FUT run file (Index, Load Cell, Time), csv or xlsx"""
+    if Path(f).suffix.lower() == '.csv':
+        return pd.read_csv(f, engine='c', float_precision='round_trip')
+    return pd.read_excel(f)
+
+def read_run_info(f):
+    """Wall clock anchor ('start', datetime) and timing of a run file, None if not recorded"""
+    path = Path(f).with_suffix('.json')
+    if not path.exists():
+        return None
+    info = json.loads(path.read_text())
+    info['start'] = datetime.fromisoformat(info['start'])
+    return info
+
+def run_files(fut_path):
+    """
+    FUT run files of a session folder, one per run sorted by name,
+    taking the csv over the xlsx of the same run
+    """
+    runs = {}
+    for suffix in reversed(FUT_SUFFIXES):
+        for f in Path(fut_path).glob(f"*{suffix}"):
+            if not f.name.startswith('~$'): # Excel lock files
+                runs[f.stem] = f
+    return [runs[stem] for stem in sorted(runs)]
@@ -1,9 +1,26 @@
-﻿import clr
+﻿import threading
+import time
+from datetime import datetime
+import clr
 import System
+import numpy as np
+from ring_buffer import RingBuffer
 clr.AddReference("FUTEK.Devices")
 import FUTEK.Devices
 from FUTEK.Devices import DeviceRepository
 
+STREAM_RATE = 200 # Hz, default streaming sampling rate (at least the analysis rate)
+BUFFER_SECONDS = 60 # seconds of streamed samples held for the reader
+POLL_INTERVAL = 0.005 # s, wait of the streaming thread when the device has no new samples
+
+def _seconds(stamp):
+    """Seconds of a stream point's TimeStamp (.NET DateTime, TimeSpan or a number)"""
+    if hasattr(stamp, 'TotalSeconds'): # TimeSpan
+        return stamp.TotalSeconds
+    if hasattr(stamp, 'Ticks'): # DateTime, 100 ns ticks
+        return stamp.Ticks / 1e7
+    return float(stamp)
+
 class FUTEKDeviceCLI:
     def __init__(self):
         self.oFUTEKDeviceRepoDLL = self.connect()
@@ -22,12 +39,111 @@ class FUTEKDeviceCLI:
 
         self.OpenedConnection = True
 
+        # Streaming mode, see start_streaming()
+        self.sampling_rate = None
+        self.ring = None # RingBuffer of (time (s since stream_start), reading) rows
+        self.stream_start = None # wall clock at time 0 of the stream
+        self.stream_error = None
+        self._stream_thread = None
+        self._stop_stream = threading.Event()
+
         # There may be no use for this variable to exist
         self.NormalData = FUTEK.Devices.DeviceUSB225.GetChannelXReading(self.USB225, 0)
         print(f"Sensor Reading: {self.NormalData:.3f}")
 
     def getNormalData(self):
         return FUTEK.Devices.DeviceUSB225.GetChannelXReading(self.USB225, 0)
+
+    def set_sampling_rate(self, rate):
+        """
+        Set the load cell channel to the lowest rate it supports of at least rate (Hz)
+
+        Returns:
+            The sampling rate set (Hz)
+        """
+        possible = list(self.USB225.GetChannelXSamplingRatePossibleValues(0)) # strings, e.g. "20"
+        usable = [value for value in possible if float(value) >= rate]
+        if not usable:
+            raise ValueError(f"Sampling rate {rate} Hz is above the maximum of "
+                             f"{max(possible, key=float)} Hz")
+        value = min(usable, key=float)
+        self.USB225.SetChannelXSamplingRate(0, value)
+        self.sampling_rate = float(value)
+        return self.sampling_rate
+
+    @property
+    def is_streaming(self):
+        return self._stream_thread is not None
+
+    def start_streaming(self, sampling_rate=STREAM_RATE, buffer_seconds=BUFFER_SECONDS):
+        """
+        Stream the load cell at a fixed sampling rate from a background thread.
+        Converted readings and their timestamps are pushed into self.ring, read
+        them with read_stream() or latest_reading(). Timestamps are the device's
+        per-sample clock in seconds since the wall-clock anchor self.stream_start
+
+        Parameters:
+            sampling_rate: Requested rate (Hz), see set_sampling_rate()
+            buffer_seconds: Seconds of samples held for a reader that falls behind
+        """
+        if self.is_streaming:
+            return
+        rate = self.set_sampling_rate(sampling_rate)
+        self.ring = RingBuffer(rate * buffer_seconds, fields=2)
+        self.stream_error = None
+        # Must run pre-streaming operations before using GetStreamingDataConverted
+        self.USB225.PreStreamingOperations()
+        self._stop_stream.clear()
+        self.stream_start = datetime.now()
+        self._stream_t0 = time.perf_counter() # monotonic clock at stream_start
+        self._stream_thread = threading.Thread(target=self._stream, name="futek-stream", daemon=True)
+        self._stream_thread.start()
+
+    def _stream(self):
+        """Streaming thread: move each batch of converted points into the ring buffer"""
+        offset = None # device clock -> seconds since stream_start
+        try:
+            while not self._stop_stream.is_set():
+                points = self.USB225.GetStreamingDataConverted()
+                received = time.perf_counter() - self._stream_t0
+                n = len(points)
+                if n == 0:
+                    self._stop_stream.wait(POLL_INTERVAL)
+                    continue
+                block = np.empty((n, 2))
+                for k, point in enumerate(points):
+                    block[k, 0] = _seconds(point.TimeStamp)
+                    block[k, 1] = point.ConvertedValue
+                if offset is None:
+                    # The newest point of the first batch was taken just before it arrived
+                    offset = received - block[-1, 0]
+                block[:, 0] += offset
+                self.ring.extend(block)
+        except Exception as e:
+            print(f"Load cell streaming stopped: {e}")
+            self.stream_error = e
+
+    def read_stream(self, cursor=0):
+        """Streamed (timestamp, reading) rows since cursor and the new cursor, see RingBuffer.read"""
+        return self.ring.read(cursor)
+
+    def latest_reading(self):
+        """Newest streamed reading, None before the first one arrives"""
+        sample = self.ring.latest()
+        return None if sample is None else sample[1]
+
+    def stop_streaming(self):
+        if not self.is_streaming:
+            return
+        self._stop_stream.set()
+        self._stream_thread.join()
+        self._stream_thread = None
+        # Must run post-streaming operations once the stream has been completed.
+        # After a failed stream the device may refuse them, closing must still go on
+        try:
+            self.USB225.PostStreamingOperations()
+        except Exception as e:
+            print(f"Post-streaming operations failed: {e}")
     
     def connect(self):
         try:
@@ -42,6 +158,8 @@ class FUTEKDeviceCLI:
             print("No open connection to close.")
             return
 
+        self.stop_streaming()
+
         self.oFUTEKDeviceRepoDLL.DisconnectAllDevices()
         if self.oFUTEKDeviceRepoDLL.DeviceCount > 0:
             print("A device is still connected.")
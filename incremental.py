@@ -0,0 +1,160 @@
+"""
+Persistent per-run results and running cross-run statistics
+
+Used by Analysis(incremental=True). Each analyzed run is stored once in
+<session>/.cache/runs. The cross-run means and variances are kept as Welford
+accumulators in <session>/.cache/running_stats.npz, so when a new run lands
+in the session only that run is processed and folded into the statistics.
+"""
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+from run_cache import UNREADABLE, _atomic_savez
+
+RUNS_DIR = "runs"
+STATS_FILE = "running_stats.npz"
+
+def params_key(**params):
+    """Short hash of the analysis parameters a stored result depends on"""
+    text = json.dumps({k: np.asarray(v).tolist() for k, v in params.items()}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+class RunningStats():
+    """
+    Welford accumulator of the element-wise mean and sample variance of a
+    sequence of equally shaped arrays (one per run)
+    """
+    def __init__(self, shape, omit_nan=False):
+        """
+        Parameters:
+            shape: Shape of each added array, e.g. (channels,)
+            omit_nan: Skip NaN elements (per-element counts) instead of propagating them
+        """
+        self.omit_nan = omit_nan
+        self.n = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def add(self, x):
+        """Fold one run's values into the statistics"""
+        x = np.asarray(x, dtype=float)
+        use = ~np.isnan(x) if self.omit_nan else np.ones(x.shape, dtype=bool)
+        n = self.n + use
+        with np.errstate(invalid='ignore'):
+            delta = x - self.mean
+            mean = self.mean + delta / np.maximum(n, 1)
+            m2 = self.m2 + delta * (x - mean)
+        self.n = n
+        self.mean = np.where(use, mean, self.mean)
+        self.m2 = np.where(use, m2, self.m2)
+
+    def std(self):
+        """Sample standard deviation (ddof=1), NaN with fewer than two values"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.n > 1, np.sqrt(self.m2 / (self.n - 1)), np.nan)
+
+    def cov(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.std() / self.mean
+
+    def get_state(self, prefix):
+        return {f"{prefix}_n": self.n, f"{prefix}_mean": self.mean, f"{prefix}_m2": self.m2}
+
+    def set_state(self, npz, prefix):
+        self.n = npz[f"{prefix}_n"]
+        self.mean = npz[f"{prefix}_mean"]
+        self.m2 = npz[f"{prefix}_m2"]
+
+class RunStore():
+    """
+    Per-run analysis results and running statistics of one session
+
+    Run results are keyed by the identity of the run's CAP and FUT files and
+    the analysis parameters, so a changed file or parameter means the run is
+    processed again.
+    """
+    def __init__(self, cache_path, params):
+        """
+        Parameters:
+            cache_path: The session's cache folder
+            params: Key from params_key() of the parameters run results depend on
+        """
+        self.params = params
+        self.runs_path = Path(cache_path) / RUNS_DIR
+        self.stats_path = Path(cache_path) / STATS_FILE
+
+    def run_key(self, cap_file, fut_file):
+        """Identity of a run: both of its files (path, size, mtime) and the parameters"""
+        parts = [self.params]
+        for f in (Path(cap_file), Path(fut_file)):
+            st = f.stat()
+            parts.append(f"{f.resolve()}|{st.st_size}|{st.st_mtime_ns}")
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+    def _run_entry(self, key):
+        return self.runs_path / f"{key}.npz"
+
+    def has_run(self, key):
+        return self._run_entry(key).exists()
+
+    def save_run(self, key, **arrays):
+        self.runs_path.mkdir(parents=True, exist_ok=True)
+        _atomic_savez(self._run_entry(key), **arrays)
+
+    def load_run(self, key):
+        """Stored arrays of one run as a dict, None when not stored or unreadable"""
+        entry = self._run_entry(key)
+        if not entry.exists():
+            return None
+        try:
+            with np.load(entry, allow_pickle=False) as npz:
+                return {name: npz[name] for name in npz.files}
+        except UNREADABLE as e:
+            print(f"Ignoring unreadable run result {entry.name}: {e}")
+            return None
+
+    def prune(self, keys):
+        """Delete stored runs that are not in keys (changed or removed run files)"""
+        if self.runs_path.exists():
+            for entry in self.runs_path.glob("*.npz"):
+                if entry.stem not in keys:
+                    entry.unlink()
+
+    def load_stats(self, names, shapes, omit_nan, keys, settings=""):
+        """
+        Running statistics folded over the runs in keys (in order)
+
+        Saved accumulators are reused when they cover a prefix of keys
+        with the same settings; only the remaining runs are added. Otherwise
+        (a run changed or was removed) they are rebuilt from the stored runs.
+
+        settings: Key of settings the statistics depend on but the stored runs
+                  do not (e.g. the channel groups), saved stats must match it
+
+        Returns:
+            ({name: RunningStats}, number of runs already folded in)
+        """
+        stats = {name: RunningStats(shapes[name], omit_nan) for name in names}
+        if not self.stats_path.exists():
+            return stats, 0
+        try:
+            with np.load(self.stats_path, allow_pickle=False) as npz:
+                done = list(npz["keys"])
+                if (str(npz["params"]) != self.params or bool(npz["omit_nan"]) != omit_nan
+                        or str(npz["settings"]) != settings or done != keys[:len(done)]):
+                    return stats, 0
+                for name in names:
+                    stats[name].set_state(npz, name)
+            return stats, len(done)
+        except UNREADABLE as e:
+            print(f"Rebuilding running statistics ({e})")
+            return {name: RunningStats(shapes[name], omit_nan) for name in names}, 0
+
+    def save_stats(self, stats, omit_nan, keys, settings=""):
+        arrays = {}
+        for name, s in stats.items():
+            arrays.update(s.get_state(name))
+        self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_savez(self.stats_path, params=np.array(self.params), omit_nan=np.array(omit_nan),
+                      settings=np.array(settings), keys=np.array(keys, dtype=str), **arrays)
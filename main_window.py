@@ -4,21 +4,20 @@ from tkinter import ttk
 from tkinter import filedialog as fd
 import numpy as np
 import time
-import xlsxwriter
-from pathlib import Path
-from datetime import datetime
 # from zaber_cli import ZaberCLI
 # from futek_cli import FUTEKDeviceCLI
 # from zaber_motion import Units
 from settings_window import SettingsWindow
 from shear_window import ShearWindow
 from analysis_window import AnalysisWindow
-from eb_analysis import Analysis
+from analysis_worker import AnalysisJob, RunPipeline, STAGE_LABELS, session_path
+from fut_io import write_run, timing_stats
+from acquisition_buffer import SampleBuffer
 class MainWindow(tk.Frame):
     def __init__(self):
         self.root = Tk(screenName=None, baseName=None, className='Tk', useTk=1)
         self.root.title("Zaber Control Stage")
-        self.root.geometry("625x375")
+        self.root.geometry("625x400")
         self.root.resizable(False, False)
 
         """
@@ -32,6 +31,8 @@ class MainWindow(tk.Frame):
         self.is_create_files = tk.BooleanVar(value=1) # this is boolean
         self.is_pause_between_runs = tk.BooleanVar(value=1) # this is boolean
         self.is_test_started = tk.BooleanVar(value=0) # this is boolean
+        self.is_save_xlsx = tk.BooleanVar(value=0) # this is boolean, Excel copy of each run file
+        self.is_analyse_runs = tk.BooleanVar(value=1) # this is boolean, analyse each run during the test
 
         # Track the current run
         self.n_runs = tk.IntVar(value=3)
@@ -54,6 +55,10 @@ class MainWindow(tk.Frame):
         self.toggle_pause = tk.BooleanVar(value=0) # this is boolean, paused=1, not paused=0
         self.is_warning_cancel = tk.BooleanVar(value=0) # this is for pause warning currently during EB test
         self.widgets = [] # when testing starts, these widgets will all get disabled
+        self.readings = SampleBuffer() # time, force and stage position of the current run
+        self.analysis_jobs = [] # analyses running in the background
+        self.run_pipeline = None # analysis of the current test's runs as they finish
+        self.cancel_analysis_btn = None
 
         self._create_widgets()
 
@@ -90,6 +95,10 @@ class MainWindow(tk.Frame):
 
             if test_type == "EB":
                 self.pause_btn.config(state=tk.NORMAL)
+                if self.is_analyse_runs.get():
+                    self.run_pipeline = RunPipeline(session_path(self.saved_path.get()),
+                                                    self.sensor_id.get(), sensor_type=3)
+                    self._start_job(self.run_pipeline)
                 self._eb_test()
             elif  test_type == "Shear":
                 self.pause_btn.config(state=tk.DISABLED)
@@ -124,6 +133,8 @@ class MainWindow(tk.Frame):
         is_paused = current_run == state
         self.update_textbox(f"Run {current_run} was paused" if is_paused 
                            else f"Run {current_run} completed")
+        if not is_paused and self.run_pipeline is not None:
+            self.run_pipeline.submit() # analysed while the next run is acquired
         
         # Handle test completion or continue to next run
         if current_run == n_runs and not is_paused:
@@ -137,6 +148,9 @@ class MainWindow(tk.Frame):
     
     def _end_testing(self):
         """ End Testing and reset variables """
+        if self.run_pipeline is not None:
+            self.run_pipeline.finish()
+            self.run_pipeline = None
         self.testing_complete()
         self.is_test_started.set(0)
         self.current_run.set(1)
@@ -212,6 +226,22 @@ class MainWindow(tk.Frame):
         # Add Widgets to list
         self.widgets.append(checkbox)
 
+    def create_xlsx_checkbox(self):
+        """ Checkbox to also save each run file as an Excel workbook """
+        checkbox = tk.Checkbutton(self.root, text="Also save runs as .xlsx",
+                                  variable=self.is_save_xlsx)
+        checkbox.grid(sticky="w", row=4, column=2, columnspan=2, pady=40)
+        # Add Widgets to list
+        self.widgets.append(checkbox)
+
+    def create_analyse_runs_checkbox(self):
+        """ Checkbox to analyse each run in the background while the next one is acquired """
+        checkbox = tk.Checkbutton(self.root, text="Analyse runs during the test",
+                                  variable=self.is_analyse_runs)
+        checkbox.grid(sticky="w", row=5, column=1, columnspan=2)
+        # Add Widgets to list
+        self.widgets.append(checkbox)
+
     def begin_test_btn(self):
         """ Opens dialog to verify settings before actually beginning tests """
         btn = tk.Button(self.root, text="Begin Test", command=self.open_settings)
@@ -232,6 +262,13 @@ class MainWindow(tk.Frame):
                                    state=tk.DISABLED)
         self.pause_btn.grid(sticky="w", row=6, column=2)
 
+    def create_cancel_analysis_btn(self):
+        """ Stops the background analyses, enabled while any is running """
+        self.cancel_analysis_btn = tk.Button(self.root, text="Cancel Analysis",
+                                             command=self.cancel_analysis,
+                                             state=tk.DISABLED)
+        self.cancel_analysis_btn.grid(sticky="w", row=6, column=1)
+
     def _helper_pause(self, *args):
         if self.toggle_pause.get() == 0:
             self.toggle_pause.set(1)
@@ -317,8 +354,9 @@ class MainWindow(tk.Frame):
             complete.grab_release()
             complete.withdraw()
         def perform_analysis(*args):
-            """Runs analysis in a separate script"""
-            analysis = Analysis(self.saved_path.get(), self.sensor_id.get(), sensor_type=3)
+            """Runs analysis in a background process, the next test can start meanwhile"""
+            new_test()
+            self.start_analysis(path, sensor)
         # Create a new top-level window
         complete = tk.Toplevel(self.root)
         complete.title("Testing complete")
@@ -331,6 +369,7 @@ class MainWindow(tk.Frame):
         heading_frame = tk.Frame(complete, width=300, height=50)
         heading_frame.grid(sticky='w', row=1, pady=10)
         sensor = self.sensor_id.get()
+        path = self.saved_path.get() # both are reset before the dialog's buttons are used
         heading = tk.Label(heading_frame, 
                            text=f"All Runs have been completed for sensor {sensor}.")
         heading.pack(padx=20, pady=20)
@@ -350,6 +389,50 @@ class MainWindow(tk.Frame):
         test_btn.grid(sticky='w', row=2, column=2, padx=5, pady=30)
         analysis_btn.grid(sticky='w', row=2, column=3, columnspan=2, padx=5, pady=30)
 
+    def start_analysis(self, path, sensor):
+        """Start analysing a session in the background and poll it for progress"""
+        self._start_job(AnalysisJob(session_path(path), sensor, sensor_type=3))
+        self.update_textbox(f"Analysis of sensor {sensor} started")
+
+    def _start_job(self, job):
+        """Start a background analysis and poll it with the others"""
+        job.start()
+        self.analysis_jobs.append(job)
+        self.cancel_analysis_btn.config(state=tk.NORMAL)
+        if len(self.analysis_jobs) == 1:
+            self.root.after(200, self._poll_analysis)
+
+    def _poll_analysis(self):
+        """Report progress of the background analyses, every 200 ms while any is running"""
+        for job in self.analysis_jobs:
+            for kind, payload in job.poll():
+                if kind == 'stage':
+                    self.update_textbox(f"Sensor {job.sensor_id}: {STAGE_LABELS.get(payload, payload)}")
+                elif kind == 'runs':
+                    self.update_textbox(f"Sensor {job.sensor_id}: {payload} run(s) analysed")
+                elif kind == 'summary':
+                    self.update_textbox(f"Sensor {job.sensor_id}: {payload}")
+                elif kind == 'done':
+                    self.update_textbox(f"Analysis of sensor {job.sensor_id} complete"
+                                        + (f", figures in {payload}" if payload else ""))
+                elif kind == 'warning':
+                    print(payload) # e.g. the run's CAP file is not exported yet, retried with the next run
+                elif kind == 'error':
+                    print(payload)
+                    self.update_textbox(f"Analysis of sensor {job.sensor_id} failed: "
+                                        f"{payload.strip().splitlines()[-1]}")
+        self.analysis_jobs = [job for job in self.analysis_jobs if job.running]
+        if self.analysis_jobs:
+            self.root.after(200, self._poll_analysis)
+        else:
+            self.cancel_analysis_btn.config(state=tk.DISABLED)
+
+    def cancel_analysis(self):
+        """Stop all background analyses"""
+        for job in self.analysis_jobs:
+            job.cancel()
+            self.update_textbox(f"Analysis of sensor {job.sensor_id} cancelled")
+
     def test_funct(self, n_runs, current_run, folder_path, sensor, zaber_comport):
         # Create a datetime object (e.g., the current date and time)
         # path = Path(self.saved_path.get())
@@ -417,16 +500,21 @@ class MainWindow(tk.Frame):
 
         #Initial params per cycle
         init_force = 1
-        force_readings = [0] * 12000 # 1-D array of zeros
-        init_time = datetime.now()
-        init_seconds = init_time.second + init_time.microsecond / 1e6
+        # Readings of this run: timestamp (s since futek.stream_start), force (N)
+        # and stage position (mm), the buffer grows as needed
+        readings = self.readings
+        readings.clear()
+
+        # The load cell is sampled at a fixed rate by its streaming thread,
+        # each loop below takes the readings that arrived since the last one
+        futek.start_streaming()
+        cursor = 0
 
         if zaber.axis.is_parked():
             zaber.axis.unpark()
         # Move actuator down
         zaber.axis.move_velocity(speed*0.1, Units.VELOCITY_MILLIMETRES_PER_SECOND)
         init_val = 0 # initial value for force
-        force_idx = 0
         while True:
             # Check if paused during the loop
             if self.toggle_pause.get() == 1: # TODO: Right here, we call recalibration script
@@ -443,24 +531,38 @@ class MainWindow(tk.Frame):
                 self.toggle_pause.set(0) # User pressed Cancel
             self.root.update()  # Keep GUI responsive
 
-            reading_force = futek.getNormalData() # Read force value
+            if futek.stream_error is not None: # streaming thread died, no more readings will arrive
+                zaber.axis.stop()
+                zaber.axis.wait_until_idle()
+                zaber.axis.move_absolute(17, Units.LENGTH_MILLIMETRES)
+                futek.stop()
+                futek.exit()
+                zaber.disconnect()
+                self.error(f"Load cell streaming stopped: {futek.stream_error}")
+                return current_run  # Return same run number to resume from where we left off
+
+            samples, cursor = futek.read_stream(cursor) # Read force values
+            if len(samples) == 0:
+                continue
+            reading_force = samples[:, 1]
 
             if isNewerUSB225:
                 reading_force = reading_force * (-4.44822) # convert pounds to Newtons and change polarity
 
             if init_force: # Verify initial values
-                init_val = reading_force # TODO: There should be an easier way than this flag
+                init_val = reading_force[0] # TODO: There should be an easier way than this flag
                 init_force = 0
             
             # Take the residual of the current force vs inital one
-            # Store residual in force_readings and print out residual
+            # Store residual with its timestamps and the stage position
             stage_force = reading_force - init_val
-            force_readings[force_idx] = stage_force
-            force_idx = force_idx + 1
+            curr_pos = zaber.axis.get_position()
+            readings.extend(time=samples[:, 0], force=stage_force,
+                            position=(curr_pos*0.047625)/1000)
             #print("Force Value: " + str(stage_force))
 
             # Once sample is hit, stop the axis
-            if stage_force >= upper_limit:
+            if np.max(stage_force) >= upper_limit:
                 zaber.axis.stop()
                 break
         
@@ -482,21 +584,31 @@ class MainWindow(tk.Frame):
                 self.toggle_pause.set(0)
             self.root.update()  # Keep GUI responsive
 
-            reading_force = futek.getNormalData()
+            if futek.stream_error is not None: # streaming thread died, no more readings will arrive
+                zaber.axis.stop()
+                zaber.axis.wait_until_idle()
+                zaber.axis.move_absolute(17, Units.LENGTH_MILLIMETRES)
+                futek.stop()
+                futek.exit()
+                zaber.disconnect()
+                self.error(f"Load cell streaming stopped: {futek.stream_error}")
+                return current_run  # Return same run number to resume from where we left off
+
+            samples, cursor = futek.read_stream(cursor)
+            reading_force = samples[:, 1]
 
             if isNewerUSB225:
                 reading_force = reading_force * (-4.44822) # convert pounds to Newtons and change polarity
 
-            # Take the residual of the current force vs inital one
-            # Store residual in force_readings and print out residual
-            stage_force = reading_force - init_val
-            force_readings[force_idx] = stage_force
-            force_idx = force_idx + 1
-            #print("Force Value: " + str(stage_force))
-
             # Grab current position
             curr_pos = zaber.axis.get_position()
             last_position = (curr_pos*0.047625)/1000
+
+            # Take the residual of the current force vs inital one
+            # Store residual with its timestamps and the stage position
+            stage_force = reading_force - init_val
+            readings.extend(time=samples[:, 0], force=stage_force, position=last_position)
+            #print("Force Value: " + str(stage_force))
             #print("Position: " + str(last_position))
             if last_position <= (currentPosition*0.047625)/1000:
                 zaber.axis.stop()
@@ -508,31 +620,19 @@ class MainWindow(tk.Frame):
         zaber.axis.move_absolute(17, Units.LENGTH_MILLIMETRES)
         #print("Run " + str(run_idx) + " completed")
 
-        # Save data to run file
-        # We could make this a separate function
-        path = Path(self.saved_path.get())
-        file_name = "Run " + str(current_run) + ".xlsx" # create file name
-        path = path / file_name
-        workbook = xlsxwriter.Workbook(path)
-        worksheet = workbook.add_worksheet(str(current_run))
+        futek.stop_streaming()
 
-        # Create Column headers
-        worksheet.write('A1', 'Index')
-        worksheet.write('B1', 'Load Cell')
-        worksheet.write('C1', 'Time')
-
-        # create time array
-
-        time = np.linspace(init_seconds, 
-                        (len(force_readings)- 1) * 0.016 + init_seconds,
-                        len(force_readings))
-        
-        # Save data arrays to file
-        for index in range(len(force_readings)):
-            worksheet.write(index+1, 0, index + 1)
-            worksheet.write(index+1, 1, force_readings[index])
-            worksheet.write(index+1, 2, time[index])
-        workbook.close()
+        # Save data to run file: Run N.csv, plus Run N.xlsx if Excel copies are enabled.
+        # Time is each reading's timestamp, Run N.json holds the wall clock at time 0.
+        # Only the filled part of the buffer is written, straight from its views
+        write_run(self.saved_path.get(), current_run, readings.view('force'), readings.view('time'),
+                  xlsx=self.is_save_xlsx.get(), start=futek.stream_start,
+                  position=readings.view('position'))
+        timing = timing_stats(readings.view('time'))
+        if timing['rate_hz']:
+            self.update_textbox(f"Run {current_run}: {len(readings)} readings at "
+                                f"{timing['rate_hz']:.1f} Hz, jitter {timing['jitter_ms']:.2f} ms, "
+                                f"max gap {timing['max_gap_ms']:.1f} ms")
 
         # Pause current run, reset sensor position manually and press enter to go to next run
         # if(current_run != n_runs):
@@ -548,12 +648,16 @@ class MainWindow(tk.Frame):
         self.enter_sensor_id()
         self.add_separator(y_value=310, window=self.root) # about every 50 px is a row
         self.create_files_checkbox()
+        self.create_xlsx_checkbox()
+        self.create_analyse_runs_checkbox()
         self.begin_test_btn()
         self.create_pause_btn()
+        self.create_cancel_analysis_btn()
         # self.navbar()
 
         self.is_test_started.trace('w', self.trace_test)
         self.toggle_pause.trace('w', self.trace_pause)
 
-main = MainWindow()
-main.root.mainloop()
+if __name__ == "__main__":
+    main = MainWindow()
+    main.root.mainloop()
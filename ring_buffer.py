@@ -0,0 +1,82 @@
+"""
+Fixed-capacity sample buffer shared by an acquisition thread and its reader
+
+Samples are rows of a preallocated numpy array (e.g. timestamp, value), so
+the acquisition thread never allocates per sample. The writer appends with
+extend(); a reader keeps a cursor and takes everything written since with
+read(), or just the newest sample with latest().
+"""
+import threading
+import numpy as np
+
+class RingBuffer():
+    """
+    Ring of the last `capacity` samples of `fields` values each
+
+    One thread writes, other threads read. A reader that falls more than
+    capacity samples behind loses the overwritten ones; they are counted
+    in dropped.
+    """
+    def __init__(self, capacity, fields=2, dtype=np.float64):
+        """
+        Parameters:
+            capacity: Samples kept before the oldest are overwritten
+            fields: Values per sample, e.g. 2 for (timestamp, value)
+            dtype: numpy dtype of the storage
+        """
+        capacity = int(capacity)
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity: {capacity}")
+        self.capacity = capacity
+        self.data = np.zeros((capacity, fields), dtype=dtype)
+        self.written = 0 # samples written since creation, the next one goes to written % capacity
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def extend(self, block):
+        """Append a (samples x fields) block, overwriting the oldest samples when full"""
+        block = np.asarray(block, dtype=self.data.dtype).reshape(-1, self.data.shape[1])
+        n = len(block)
+        skip = max(n - self.capacity, 0) # only the newest capacity samples can be kept
+        block = block[skip:]
+        with self._lock:
+            start = (self.written + skip) % self.capacity
+            first = min(len(block), self.capacity - start)
+            self.data[start:start + first] = block[:first]
+            self.data[:len(block) - first] = block[first:]
+            self.written += n
+
+    def read(self, cursor=0):
+        """
+        Samples written since cursor, oldest first
+
+        Parameters:
+            cursor: The cursor returned by the previous read, 0 for everything still held
+
+        Returns:
+            (copy of the samples, new cursor)
+        """
+        with self._lock:
+            written = self.written
+            oldest = max(written - self.capacity, 0)
+            if cursor < oldest:
+                self.dropped += oldest - cursor
+                cursor = oldest
+            start, stop = cursor % self.capacity, written % self.capacity
+            if written - cursor == 0:
+                samples = self.data[:0].copy()
+            elif start < stop:
+                samples = self.data[start:stop].copy()
+            else: # wraps around the end of the array
+                samples = np.concatenate((self.data[start:], self.data[:stop]))
+        return samples, written
+
+    def latest(self):
+        """Newest sample (copy), None before the first write"""
+        with self._lock:
+            if self.written == 0:
+                return None
+            return self.data[(self.written - 1) % self.capacity].copy()
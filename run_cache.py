@@ -0,0 +1,121 @@
+from pathlib import Path
+import os
+import tempfile
+import zipfile
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = ".cache"
+CACHE_VERSION = 3 # bump when the cleaned layout of a run file changes
+
+# Errors of a truncated or corrupt .npz, read as a cache miss
+UNREADABLE = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+def _atomic_savez(path, **arrays):
+    """
+    Write an npz next to path and swap it in, so a crash never leaves half a
+    file. The temporary file is unique, so concurrent writers (a background
+    run analysis and a full one) cannot interleave their data.
+    """
+    # Not named *.npz, so the globs over cache entries never pick it up
+    fd, tmp = tempfile.mkstemp(prefix=path.stem + ".", suffix=".npz.tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+class RunCache():
+    """
+    On-disk cache of parsed CAP/FUT run files
+
+    Each run file gets one uncompressed .npz entry in <session>/.cache holding
+    its cleaned columns. An entry is only reused when the path, size and mtime
+    of the source file still match, so editing or replacing a run file
+    invalidates it automatically.
+    """
+    def __init__(self, session_path, enabled=True):
+        """
+        Parameters:
+            session_path: Session folder that holds the CAP and FUT folders
+            enabled: False bypasses the cache (always parse, never write)
+        """
+        self.enabled = enabled
+        self.cache_path = Path(session_path) / CACHE_DIR
+
+    def load(self, f, reader, variant=""):
+        """
+        Return the cleaned DataFrame for f, only calling reader(f) on a cache miss
+
+        variant: Reader settings that change the cleaned data (e.g. dtype), part of the key
+        """
+        if not self.enabled:
+            return reader(f)
+
+        f = Path(f)
+        entry = self._entry(f)
+        key = self._key(f, variant)
+        df = self._read(entry, key)
+        if df is None:
+            df = reader(f)
+            self._write(entry, key, df)
+        return df
+
+    def clear(self):
+        """Delete every cached entry of this session"""
+        if self.cache_path.exists():
+            for entry in self.cache_path.glob("*.npz"):
+                entry.unlink()
+            # Signal files left behind by analyses that could not remove them,
+            # temporary files of writes that were interrupted
+            for entry in [*self.cache_path.glob("signals_*.bin"), *self.cache_path.glob("*.npz.tmp")]:
+                try:
+                    entry.unlink()
+                except OSError:
+                    pass # still in use
+
+    def _key(self, f, variant=""):
+        """Identity of a source file: a change in any field invalidates its entry"""
+        st = f.stat()
+        return f"{CACHE_VERSION}|{variant}|{f.resolve()}|{st.st_size}|{st.st_mtime_ns}"
+
+    def _entry(self, f):
+        """Cache file for a run file, e.g. .cache/FUT_Run 1.npz"""
+        return self.cache_path / f"{f.parent.name}_{f.stem}.npz"
+
+    def _read(self, entry, key):
+        if not entry.exists():
+            return None
+        try:
+            with np.load(entry, allow_pickle=False) as npz:
+                if str(npz["key"]) != key:
+                    return None # stale, source file changed
+                columns = list(npz["columns"])
+                return pd.DataFrame({name: npz[f"col{idx}"]
+                                     for idx, name in enumerate(columns)})
+        except UNREADABLE as e:
+            print(f"Ignoring unreadable cache entry {entry.name}: {e}")
+            return None
+
+    def _write(self, entry, key, df):
+        arrays = {}
+        for idx, name in enumerate(df.columns):
+            col = df[name]
+            if isinstance(col.dtype, pd.DatetimeTZDtype):
+                col = col.dt.tz_convert(None) # store as naive UTC
+            values = col.to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            arrays[f"col{idx}"] = values
+
+        try:
+            self.cache_path.mkdir(exist_ok=True)
+            _atomic_savez(entry, key=np.array(key), columns=np.array(df.columns, dtype=str), **arrays)
+        except OSError as e:
+            # A read-only session folder should not stop the analysis
+            print(f"Could not write cache entry {entry.name}: {e}")
@@ -0,0 +1,59 @@
+"""
+Out-of-core storage of the resampled and synced signals of one analysis
+
+All arrays of a session are appended to a single flat file in the session's
+.cache folder and handed back as read-only np.memmap views, so the signals
+live in the OS page cache instead of the process heap. Used by
+Analysis(out_of_core=True).
+"""
+import os
+import tempfile
+import weakref
+from pathlib import Path
+import numpy as np
+
+class SignalStore():
+    """
+    Append-only memory-mapped array file
+
+    Every Analysis gets its own file, so two analyses of the same session
+    never map each other's data. The file is removed with the store.
+    """
+    def __init__(self, cache_path):
+        """
+        Parameters:
+            cache_path: Folder the signal file is created in (the session's .cache)
+        """
+        cache_path = Path(cache_path)
+        cache_path.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="signals_", suffix=".bin", dir=cache_path)
+        os.close(fd)
+        self.path = Path(path)
+        self.index = {} # name -> (offset, shape, dtype)
+        self._finalizer = weakref.finalize(self, _remove, self.path)
+
+    def put(self, name, arr):
+        """Append arr to the file and return it as a read-only memmap"""
+        arr = np.ascontiguousarray(arr)
+        with open(self.path, "ab") as fh:
+            offset = fh.tell()
+            arr.tofile(fh)
+        self.index[name] = (offset, arr.shape, arr.dtype)
+        return self.get(name)
+
+    def get(self, name):
+        """Read-only memmap of a stored array"""
+        offset, shape, dtype = self.index[name]
+        if int(np.prod(shape)) == 0:
+            return np.empty(shape, dtype=dtype) # mmap cannot map zero bytes
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    def close(self):
+        """Delete the signal file; memmaps handed out before stay valid where the OS allows"""
+        self._finalizer()
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass # still mapped (Windows), left for the next cache clear
@@ -0,0 +1,129 @@
+"""
+Per-stage and per-run instrumentation of Analysis
+
+Records wall time, CPU time and (optionally) traced memory allocations of
+each pipeline stage and of the per-run work inside it. Turned on with
+Analysis(profile=...) or the EB_ANALYSIS_PROFILE environment variable
+("1" for timings, "memory" to also trace allocations). When off, measure()
+hands back one shared do-nothing context, so the hooks cost nothing.
+"""
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+ENV_VAR = "EB_ANALYSIS_PROFILE"
+_OFF = nullcontext()
+
+def profile_mode(profile=None):
+    """
+    Resolve a profile argument to False, True (timings) or 'memory' (timings
+    and allocations); None falls back to the EB_ANALYSIS_PROFILE environment variable
+    """
+    if profile is None:
+        env = os.environ.get(ENV_VAR, "").strip().lower()
+        profile = 'memory' if env == 'memory' else env in ('1', 'true', 'yes', 'on')
+    if profile not in (False, True, 'memory'):
+        raise ValueError(f"Invalid profile: {profile}")
+    return profile
+
+class StageProfiler():
+    """
+    Collects one record per measured block: stage name, run index (or None
+    for a whole stage), wall/CPU seconds and, in 'memory' mode, the net
+    allocation and peak (MB) while it ran
+    """
+    def __init__(self, mode=False):
+        """
+        Parameters:
+            mode: False (off), True (timings) or 'memory' (timings and allocations)
+        """
+        self.mode = mode
+        self.enabled = bool(mode)
+        self.records = []
+        self._stack = [] # open stage measurements, for self time of nested stages
+
+    def measure(self, stage, run=None):
+        """Context manager recording the enclosed block under stage (and run)"""
+        if not self.enabled:
+            return _OFF
+        return self._measure(stage, run)
+
+    @contextmanager
+    def _measure(self, stage, run):
+        started_tracing = False
+        if self.mode == 'memory' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        tracing = tracemalloc.is_tracing()
+
+        frame = {'child_wall': 0.0, 'child_cpu': 0.0, 'peak_seen': 0}
+        if tracing:
+            mem_start = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['peak_seen'] = max(self._stack[-1]['peak_seen'], mem_start[1])
+            tracemalloc.reset_peak()
+        if run is None:
+            self._stack.append(frame)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            if run is None:
+                self._stack.pop()
+            record = {'stage': stage, 'run': run, 'wall_s': wall, 'cpu_s': cpu}
+            if run is None:
+                # A stage's own time, without the stages it called first
+                record['self_wall_s'] = wall - frame['child_wall']
+                record['self_cpu_s'] = cpu - frame['child_cpu']
+                if self._stack:
+                    self._stack[-1]['child_wall'] += wall
+                    self._stack[-1]['child_cpu'] += cpu
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, frame['peak_seen'])
+                if self._stack:
+                    self._stack[-1]['peak_seen'] = max(self._stack[-1]['peak_seen'], peak)
+                record['alloc_mb'] = (current - mem_start[0]) / 2**20
+                record['peak_mb'] = (peak - mem_start[0]) / 2**20
+            if started_tracing:
+                tracemalloc.stop()
+            self.records.append(record)
+
+    def extend(self, records):
+        """Add records measured elsewhere, e.g. by a worker process"""
+        self.records.extend(records)
+
+    def report(self):
+        """
+        Structured report:
+            stages: {stage: calls, wall_s, cpu_s (self time) [, peak_mb]}
+            runs: [per-run records]
+            total_wall_s / total_cpu_s: sum of the stages' self time
+        """
+        stages = {}
+        for r in self.records:
+            if r['run'] is not None:
+                continue
+            s = stages.setdefault(r['stage'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            s['calls'] += 1
+            s['wall_s'] += r['self_wall_s']
+            s['cpu_s'] += r['self_cpu_s']
+            if 'peak_mb' in r:
+                s['peak_mb'] = max(s.get('peak_mb', 0.0), r['peak_mb'])
+        return {'mode': self.mode, 'stages': stages,
+                'runs': [r for r in self.records if r['run'] is not None],
+                'total_wall_s': sum(s['wall_s'] for s in stages.values()),
+                'total_cpu_s': sum(s['cpu_s'] for s in stages.values())}
+
+    def to_json(self, path=None):
+        """Report as JSON text, also written to path if given"""
+        text = json.dumps(self.report(), indent=1)
+        if path is not None:
+            with open(path, 'w') as fh:
+                fh.write(text)
+        return text
@@ -0,0 +1,181 @@
+"""
+Synthetic EB sessions in the on-disk formats of the sensor app and the test stage
+
+A session is written as <root>/<sensor_id>/<MM DD YY>_<area>_EB/{CAP,FUT} with
+one CAP csv (sensor app export, 26 column header and metadata row) and one FUT
+run file per run, so it can be fed to Analysis and batch_analysis like a real
+session. The force follows the stage's slow loading ramp up to the upper limit
+and quick release; each channel's CAP follows a sigmoid P.S curve of the
+pressure, with noise, so every channel has a clear inflection point.
+
+Usage:
+    python synthetic_data.py <root> [--runs 3] [--duration 120] [--shorted 2 5]
+"""
+import argparse
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import fut_io
+
+CAP_HEADER = ['Elapsed time(s)', 'wall_clock(s)', 'battery', 'capacitor_channel_count',
+              'motion_channel_count'] + [f'cap{j}(pF)' for j in range(1, 9)] + \
+             ['accx', 'accy', 'accz', 'event_id', 'event_kind', 'patient_id', 'patient_notes',
+              'session_id', 'session_start_time', 'procedure_description',
+              'procedure_sensor_placement', 'procedure_series', 'procedure_notes']
+
+def force_profile(t, t_contact, t_peak, peak_force, t_release=1.0):
+    """
+    Load cell force (N) of one run: zero until contact, a quadratic loading
+    ramp up to peak_force at t_peak, then a linear release back to zero
+    """
+    force = np.zeros_like(t)
+    loading = (t >= t_contact) & (t <= t_peak)
+    force[loading] = peak_force * ((t[loading] - t_contact) / (t_peak - t_contact))**2
+    release = (t > t_peak) & (t < t_peak + t_release)
+    force[release] = peak_force * (1 - (t[release] - t_peak) / t_release)
+    return force
+
+def ps_curve(pressure, amplitude, p_inflection, width, slope=0.01):
+    """Change in CAP (pF) at each pressure (kPa): sigmoid with its steepest point at p_inflection"""
+    sigmoid = 1 / (1 + np.exp(-(pressure - p_inflection) / width))
+    offset = 1 / (1 + np.exp(p_inflection / width))
+    return amplitude * (sigmoid - offset) + slope * pressure
+
+def make_run(duration=120.0, cap_rate=98.4, fut_rate=62.5, ch=8, noise=0.003, shorted=(),
+             peak_force=20.0, ramp=30.0, SA=325e-6, cap_delay=25.0, jitter=0.0, rng=None):
+    """
+    Signals of one run
+
+    Parameters:
+        duration: Length of the FUT capture (s); the CAP capture starts cap_delay s earlier
+        cap_rate: CAP sample rate (Hz)
+        fut_rate: Load cell sample rate (Hz)
+        ch: Number of CAP channels
+        noise: Standard deviation of the CAP noise (pF)
+        shorted: Channels (0-based) that read as shorted (> 10 pF change)
+        peak_force: Upper force limit of the stage (N)
+        ramp: Length of the loading ramp from contact to peak_force (s)
+        SA: Sensor surface area (m^2)
+        cap_delay: Seconds the CAP capture starts before the load cell capture
+        jitter: Standard deviation (s) of the load cell timestamps around the nominal rate
+        rng: np.random.Generator
+
+    Returns:
+        (cap_time, cap (samples x ch), fut_time, force)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+
+    # Contact after 40% of the capture, then the stage's loading ramp
+    t_contact = 0.40 * duration
+    t_peak = t_contact + ramp
+    if t_peak + 5 > duration:
+        raise ValueError(f"duration {duration} s is too short for a {ramp} s loading ramp")
+    fut_time = np.arange(0, duration, 1 / fut_rate)
+    if jitter:
+        fut_time = fut_time + rng.normal(0, jitter, len(fut_time))
+        fut_time[0] = 0.0
+    force = force_profile(fut_time, t_contact, t_peak, peak_force)
+    force[force > 0] += rng.normal(0, 0.002, np.count_nonzero(force > 0))
+
+    # CAP samples the same force history, shifted by the capture delay
+    cap_time = np.arange(0, duration + cap_delay, 1 / cap_rate)
+    pressure = force_profile(cap_time - cap_delay, t_contact, t_peak, peak_force) / SA / 1000
+
+    baseline = rng.uniform(19, 25, ch)
+    amplitude = rng.uniform(4.0, 4.6, ch)
+    p_inflection = rng.uniform(5.0, 8.5, ch)
+    width = amplitude / (4 * rng.uniform(0.35, 0.6, ch)) # peak slope 0.35-0.6 pF/kPa
+    cap = baseline + ps_curve(pressure[:, None], amplitude, p_inflection, width)
+    cap += rng.normal(0, noise, cap.shape)
+    for j in shorted:
+        cap[:, j] += np.where(pressure > 1, 50.0, 0.0)
+    return cap_time, cap, fut_time, force
+
+def write_cap_file(path, cap_time, cap, start, run_label, session_id):
+    """Write a CAP csv in the sensor app's export format"""
+    n, ch = cap.shape
+    stamps = np.datetime64(start, 'ms') + np.round(cap_time * 1000).astype('timedelta64[ms]')
+    wall_clock = np.char.add(np.datetime_as_string(stamps, unit='ms'), '-0800')
+    data = {CAP_HEADER[0]: cap_time, CAP_HEADER[1]: wall_clock, CAP_HEADER[2]: 100.0,
+            CAP_HEADER[3]: float(ch), CAP_HEADER[4]: 3.0}
+    for j in range(8):
+        data[CAP_HEADER[5 + j]] = cap[:, j] if j < ch else np.nan
+    data.update(accx=-0.0073, accy=-0.0117, accz=-0.9957)
+    body = pd.DataFrame(data)
+
+    # Interstitial metadata row: no sample values, just the session fields
+    meta = [''] * len(CAP_HEADER)
+    meta[CAP_HEADER.index('patient_id')] = run_label
+    meta[CAP_HEADER.index('session_id')] = session_id
+    meta[CAP_HEADER.index('session_start_time')] = start.isoformat(timespec='milliseconds') + '-0800'
+
+    with open(path, 'w', newline='') as fh:
+        fh.write(','.join(CAP_HEADER) + '\n')
+        fh.write(','.join(meta) + '\n')
+        body.to_csv(fh, header=False, index=False)
+
+def make_session(root, sensor_id=99999, n_runs=3, fut_format='csv', date=None, seed=0, **run_params):
+    """
+    Write a synthetic session and return its folder
+
+    Parameters:
+        root: Data root, the session goes in <root>/<sensor_id>/<MM DD YY>_325mm2_EB
+        sensor_id: Sensor ID folder name
+        n_runs: Number of runs
+        fut_format: 'csv', 'xlsx' (legacy sessions) or 'both'
+        date: datetime of the first run, default today at 9:00
+        seed: Seed of the random generator, the same seed writes the same session
+        run_params: Passed to make_run (duration, cap_rate, fut_rate, ch, noise, shorted, ...)
+    """
+    if fut_format not in ('csv', 'xlsx', 'both'):
+        raise ValueError(f"Invalid fut_format: {fut_format}")
+    rng = np.random.default_rng(seed)
+    date = date or datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    session = Path(root) / str(sensor_id) / f"{date:%m %d %y}_325mm2_EB"
+    (session / "CAP").mkdir(parents=True, exist_ok=True)
+    (session / "FUT").mkdir(parents=True, exist_ok=True)
+    session_id = str(uuid.UUID(bytes=rng.bytes(16))).upper()
+
+    for run in range(1, n_runs + 1):
+        cap_time, cap, fut_time, force = make_run(rng=rng, **run_params)
+        start = date + timedelta(minutes=2 * (run - 1))
+        write_cap_file(session / "CAP" / f"run {run}__{start:%Y_%m_%dT%H_%M_%S}-0800.csv",
+                       cap_time, cap, start, f"run {run}", session_id)
+
+        if fut_format in ('csv', 'both'):
+            fut_start = start + timedelta(seconds=run_params.get('cap_delay', 25.0))
+            fut_io.write_run(session / "FUT", run, force, fut_time, xlsx=fut_format == 'both',
+                             start=fut_start)
+        else:
+            fut_io.write_run_xlsx(session / "FUT" / f"Run {run}.xlsx", run,
+                                  np.arange(1, len(force) + 1), force, fut_time)
+    return session
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic EB session")
+    parser.add_argument("root", help="data root the <sensor_id>/<session> folder is written to")
+    parser.add_argument("--sensor-id", type=int, default=99999)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=120.0, help="load cell capture length (s)")
+    parser.add_argument("--cap-rate", type=float, default=98.4, help="CAP sample rate (Hz)")
+    parser.add_argument("--fut-rate", type=float, default=62.5, help="load cell sample rate (Hz)")
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--noise", type=float, default=0.003, help="CAP noise std (pF)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="load cell timestamp jitter std (s)")
+    parser.add_argument("--shorted", type=int, nargs="*", default=[], help="shorted channels (0-7)")
+    parser.add_argument("--fut-format", default='csv', choices=['csv', 'xlsx', 'both'])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    session = make_session(args.root, sensor_id=args.sensor_id, n_runs=args.runs,
+                           fut_format=args.fut_format, seed=args.seed,
+                           duration=args.duration, cap_rate=args.cap_rate,
+                           fut_rate=args.fut_rate, ch=args.channels, noise=args.noise,
+                           shorted=args.shorted, jitter=args.jitter)
+    print(f"Session written to {session}")
+
+if __name__ == "__main__":
+    main()
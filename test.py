@@ -4,10 +4,12 @@ sensor_id = 12345
 path = rf'C:/Users/emili/OneDrive/Documents/Projects/VenaVitals/zaber-python/12345/02 02 26_325mm2_EB'
 sensor_type = 3
 
-# Create analysis instance
-analysis = Analysis(path, sensor_id, sensor_type)
+# Guard is required: runs are loaded in a process pool, which re-imports this script on Windows
+if __name__ == "__main__":
+    # Create analysis instance (pass use_cache=False to force re-parsing the run files)
+    analysis = Analysis(path, sensor_id, sensor_type)
 
-# Get results
-result = analysis.save_data()
+    # Get results
+    result = analysis.save_data()
 
-print(result)
\ No newline at end of file
+    print(result)